@@ -0,0 +1,73 @@
+"""
+Production serving helpers shared by ``gunicorn.conf.py`` and the startup
+benchmark.
+
+Worker counts are derived from the number of usable CPU cores and from how
+much of the request mix is spent in CPU-bound password hashing, and
+``warm_up()`` initialises everything that is otherwise built lazily on the
+first request so that pre-forked workers share it copy-on-write.
+"""
+import os
+
+
+def usable_cpu_count():
+    """Cores this process may run on (respects container CPU affinity)."""
+    try:
+        return len(os.sched_getaffinity(0)) or 1
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def default_workers(cpu_count=None, hashing_load=0.5):
+    """
+    Number of worker processes.
+
+    ``hashing_load`` is the share (0..1) of request time spent in password
+    hashing. Pure I/O-bound traffic gets the usual ``2 * cores + 1``; as the
+    hashing share grows the count shrinks towards ``cores + 1`` because extra
+    processes only queue up on the same cores.
+    """
+    cores = cpu_count or usable_cpu_count()
+    hashing_load = min(max(hashing_load, 0.0), 1.0)
+    return max(2, int(cores * (2 - hashing_load)) + 1)
+
+
+def default_threads(hashing_load=0.5):
+    """Threads per ``gthread`` worker; I/O-heavy mixes benefit from more."""
+    hashing_load = min(max(hashing_load, 0.0), 1.0)
+    return max(1, round(4 * (1 - hashing_load)) + 1)
+
+
+def warm_up():
+    """
+    Build lazily initialised state in the current process: URL resolver,
+    serializer fields, password hasher, JWT signing key and the username/email
+    availability index. Call this in the master before forking workers.
+    """
+    import django
+    django.setup()
+
+    from django.contrib.auth.hashers import get_hasher
+    from django.db import connections
+    from django.urls import get_resolver
+    from rest_framework_simplejwt.state import token_backend
+
+    from api.availability import availability_index
+    from api.serializers import UserRegistrationSerializer, UserLoginSerializer
+
+    resolver = get_resolver()
+    resolver.reverse_dict  # noqa: B018 - populates the reverse lookup tables
+    resolver.resolve('/api/auth/health/')
+
+    UserRegistrationSerializer().fields
+    UserLoginSerializer().fields
+
+    hasher = get_hasher()
+    hasher.encode('warm-up', hasher.salt())
+
+    token_backend.decode(token_backend.encode({'warm_up': True}))
+
+    availability_index.rebuild()
+
+    # Connections must not be inherited by forked workers.
+    connections.close_all()
@@ -44,7 +44,7 @@ INSTALLED_APPS = [
 # REST Framework configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.ShardAwareJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -73,6 +73,52 @@ SIMPLE_JWT = {
 
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
+
+    'TOKEN_OBTAIN_SERIALIZER': 'api.device_sessions.SessionTokenObtainPairSerializer',  # Device session per token pair
+    'TOKEN_REFRESH_SERIALIZER': 'api.refresh.SingleFlightTokenRefreshSerializer',  # One rotation per refresh token
+}
+
+# Embed the user's permissions in access tokens (``perms``/``pv`` claims), so API
+# permission checks need no query while the permissions are unchanged.
+# Like the permission cache, only used with a cache shared by all workers.
+JWT_PERMISSIONS_CLAIM = False
+
+# Seconds a cached permission set is kept; changes invalidate it right away.
+# Off (one query per request, as in stock Django) while CACHES is process-local,
+# since a change made in one process would go unseen by the others.
+PERMISSION_CACHE_TIMEOUT = 3600
+
+# Concurrent refreshes of the same token share one rotation for this long
+TOKEN_REFRESH_GRACE_SECONDS = 10
+
+# Add users created by other workers to the in-memory username/email
+# availability index this often (seconds, in a background thread)
+AVAILABILITY_INDEX_REFRESH_INTERVAL = 300
+
+# On-demand request profiling (manage.py profile_requests)
+PROFILING_OUTPUT_DIR = BASE_DIR / 'profiles'
+PROFILING_SAMPLE_INTERVAL = 0.005  # Seconds between stack samples
+PROFILING_CONFIG_REFRESH = 1.0  # Seconds between checks of the on/off switch
+
+# Side effects delivered by manage.py run_outbox
+OUTBOX_MAX_ATTEMPTS = 8  # Give up on a message after this many failures
+OUTBOX_BACKOFF_BASE = 2  # Seconds before the first retry, doubled for every further one
+OUTBOX_BACKOFF_MAX = 3600
+OUTBOX_LEASE_SECONDS = 600  # Redelivered after this if the worker dies; must cover a whole batch
+OUTBOX_WEBHOOK_URLS = []  # Each receives a JSON POST for every new user
+OUTBOX_WEBHOOK_TIMEOUT = 5
+
+# Emails are written to files locally; point this at SMTP in production.
+EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+EMAIL_FILE_PATH = BASE_DIR / 'sent_emails'
+DEFAULT_FROM_EMAIL = 'noreply@localhost'
+
+# Use a shared backend (e.g. Redis) in production so that coordination
+# through the cache spans all worker processes.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
 }
 
 
@@ -87,7 +133,15 @@ CORS_ALLOW_CREDENTIALS = True
 
 AUTH_USER_MODEL = 'api.User'
 
+# New user ids are time-ordered UUIDv7 (4 = random UUIDv4)
+USER_ID_UUID_VERSION = 7
+
+AUTHENTICATION_BACKENDS = [
+    'api.backends.ArchiveAwareModelBackend',  # Restores archived users on login
+]
+
 MIDDLEWARE = [
+    'api.profiling.SamplingProfilerMiddleware',  # No-op until enabled with manage.py profile_requests
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -127,6 +181,12 @@ DATABASES = {
     }
 }
 
+# Databases holding users, e.g. ['shard_0', 'shard_1'] (see Backend/settings_sharded.py).
+# Empty keeps every user on 'default'.
+USER_SHARDS = []
+
+DATABASE_ROUTERS = ['api.routers.UserShardRouter']
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
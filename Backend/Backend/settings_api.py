@@ -0,0 +1,39 @@
+"""
+API-only settings for worker processes that serve ``/api/``.
+
+Drops the admin, sessions, messages, static files and the template engine,
+none of which the JWT-authenticated JSON API uses, so API workers import and
+keep resident less code. Serve the admin from a separate process running the
+default ``Backend.settings``:
+
+    DJANGO_SETTINGS_MODULE=Backend.settings_api gunicorn -c gunicorn.conf.py
+"""
+from .settings import *  # noqa: F401,F403
+
+ADMIN_ONLY_APPS = (
+    'django.contrib.admin',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+)
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in ADMIN_ONLY_APPS]
+
+MIDDLEWARE = [
+    'api.profiling.SamplingProfilerMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+ROOT_URLCONF = 'Backend.urls_api'
+
+TEMPLATES = []
+
+# The browsable API needs templates; API workers only speak JSON.
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+    ],
+}
@@ -0,0 +1,27 @@
+"""
+Local sharding profile: users spread over three SQLite files.
+
+    python manage.py migrate --settings=Backend.settings_sharded --database=shard_0  # ... for every alias
+    python manage.py test api.tests.ShardingTests --settings=Backend.settings_sharded
+
+``default`` keeps the tables that are not sharded, and queries without
+``using()`` go there: ``User.objects.filter(...)`` sees no users. The admin
+(a "shard" filter on the changelists), ``createsuperuser`` and lookups by
+username find the right shard themselves; ``changepassword`` and ``dumpdata``
+need ``--database=<shard>``. Only ``ShardingTests`` is written for this
+profile; the rest of the suite assumes a single database.
+"""
+from .settings import *  # noqa: F401,F403
+
+USER_SHARDS = ['shard_0', 'shard_1', 'shard_2']
+
+DATABASES = {
+    'default': DATABASES['default'],
+    **{
+        alias: {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / f'{alias}.db',
+        }
+        for alias in USER_SHARDS
+    },
+}
@@ -0,0 +1,37 @@
+"""
+Test profile, used by ``python manage.py test`` unless ``--settings`` or
+DJANGO_SETTINGS_MODULE says otherwise.
+
+Passwords are hashed with MD5 instead of PBKDF2, the database lives in
+memory and cache, email and profiler output stay local to the process, so
+the suite is fast and can run with ``--parallel``.
+"""
+import os
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+
+# No background refresh thread; tests call ``availability_index.refresh()``.
+AVAILABILITY_INDEX_REFRESH_INTERVAL = 0
+
+PROFILING_OUTPUT_DIR = os.path.join(tempfile.gettempdir(), 'backend-test-profiles')
+
+TEST_RUNNER = 'Backend.test_runner.TimedDiscoverRunner'
+TEST_TIME_BUDGET = 10  # Seconds; the runner warns when the suite takes longer
@@ -0,0 +1,24 @@
+"""
+Test runner that reports the suite's wall time, so a slowing feedback loop
+is noticed. Set ``TEST_TIME_BUDGET`` (seconds) to be warned when the suite
+takes longer than that.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class TimedDiscoverRunner(DiscoverRunner):
+
+    def run_tests(self, test_labels, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().run_tests(test_labels, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.log(f'Test suite wall time: {elapsed:.2f}s')
+            budget = getattr(settings, 'TEST_TIME_BUDGET', None)
+            if budget is not None and elapsed > budget:
+                self.log(f'Test suite exceeded its {budget}s budget.', level=logging.WARNING)
@@ -0,0 +1,25 @@
+"""
+URL configuration for API-only worker processes (``Backend.settings_api``).
+
+Contains every API route but not the admin, so API workers never import
+``django.contrib.admin``. ``Backend.urls`` extends these patterns with the
+admin site.
+"""
+from django.urls import path, include
+from rest_framework_simplejwt.views import (
+    TokenObtainPairView,
+    TokenRefreshView,
+    TokenVerifyView,
+)
+
+
+
+urlpatterns = [
+    path('api/auth/', include('api.urls')),
+
+    # JWT Token endpoints
+    path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/verify/', TokenVerifyView.as_view(), name='token_verify'),
+
+]
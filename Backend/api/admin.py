@@ -1,10 +1,86 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User
+from django.core.exceptions import ValidationError
+from .models import User, ArchivedUser, DeviceSession, OutboxMessage
+from .sharding import sharding_enabled, user_shards
+
+
+def selected_shard(request):
+    alias = request.GET.get(ShardListFilter.parameter_name)
+    return alias if alias in user_shards() else user_shards()[0]
+
+
+class ShardListFilter(admin.SimpleListFilter):
+    """Picks the one shard whose rows the changelist shows."""
+    title = 'shard'
+    parameter_name = 'shard'
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in user_shards()]
+
+    def queryset(self, request, queryset):
+        # Applied by ``ShardedAdminMixin.get_queryset``, so counts agree.
+        return queryset
+
+    def choices(self, changelist):
+        current = self.value() if self.value() in user_shards() else user_shards()[0]
+        for alias, title in self.lookup_choices:
+            yield {
+                'selected': alias == current,
+                'query_string': changelist.get_query_string({self.parameter_name: alias}),
+                'display': title,
+            }
+
+
+class ShardedAdminMixin:
+    """
+    Admin for models living on the user shards. Queries without a database go
+    to ``default``, which holds none of these rows once ``USER_SHARDS`` is
+    set, so the changelist reads the shard picked by ``ShardListFilter`` and
+    single objects are looked up on every shard.
+    """
+
+    def get_list_filter(self, request):
+        list_filter = super().get_list_filter(request)
+        return (ShardListFilter, *list_filter) if sharding_enabled() else list_filter
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return queryset.using(selected_shard(request)) if sharding_enabled() else queryset
+
+    def get_object(self, request, object_id, from_field=None):
+        if not sharding_enabled():
+            return super().get_object(request, object_id, from_field)
+        queryset = super().get_queryset(request)
+        field = self.model._meta.pk if from_field is None else self.model._meta.get_field(from_field)
+        try:
+            object_id = field.to_python(object_id)
+        except (ValidationError, ValueError):
+            return None
+        for alias in user_shards():
+            obj = queryset.using(alias).filter(**{field.name: object_id}).first()
+            if obj is not None:
+                return obj
+        return None
+
+    # ``LogEntry`` rows live on ``default`` with a foreign key to the acting
+    # user, who lives on a shard; with shards the history is not recorded.
+
+    def log_addition(self, request, obj, message):
+        if not sharding_enabled():
+            return super().log_addition(request, obj, message)
+
+    def log_change(self, request, obj, message):
+        if not sharding_enabled():
+            return super().log_change(request, obj, message)
+
+    def log_deletions(self, request, queryset):
+        if not sharding_enabled():
+            return super().log_deletions(request, queryset)
 
 
 @admin.register(User)
-class CustomUserAdmin(UserAdmin):
+class CustomUserAdmin(ShardedAdminMixin, UserAdmin):
     list_display = ('username', 'email', 'first_name', 'last_name', 'is_staff', 'created_at')
     list_filter = ('is_staff', 'is_superuser', 'is_active', 'created_at')
     search_fields = ('username', 'email', 'first_name', 'last_name')
@@ -17,4 +93,28 @@ class CustomUserAdmin(UserAdmin):
         }),
     )
 
-    readonly_fields = ('created_at', 'updated_at', 'id')
\ No newline at end of file
+    readonly_fields = ('created_at', 'updated_at', 'id')
+
+@admin.register(ArchivedUser)
+class ArchivedUserAdmin(ShardedAdminMixin, admin.ModelAdmin):
+    list_display = ('username', 'email', 'last_login', 'archived_at')
+    search_fields = ('username', 'email')
+    ordering = ('-archived_at',)
+    readonly_fields = [field.name for field in ArchivedUser._meta.fields]
+
+
+@admin.register(DeviceSession)
+class DeviceSessionAdmin(ShardedAdminMixin, admin.ModelAdmin):
+    list_display = ('user', 'device_label', 'created_at', 'last_used_at', 'revoked_at')
+    list_filter = ('revoked_at',)
+    search_fields = ('user__username', 'device_label')
+    ordering = ('-last_used_at',)
+    readonly_fields = ('id', 'user', 'refresh_jti', 'created_at', 'last_used_at')
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(ShardedAdminMixin, admin.ModelAdmin):
+    list_display = ('topic', 'status', 'attempts', 'available_at', 'created_at', 'delivered_at')
+    list_filter = ('status', 'topic')
+    ordering = ('-created_at',)
+    readonly_fields = ('created_at', 'delivered_at', 'last_error')
@@ -0,0 +1,125 @@
+import logging
+from datetime import timedelta
+
+from django.contrib.auth.hashers import check_password
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import User, ArchivedUser
+from .sharding import shard_for_username, user_databases
+
+logger = logging.getLogger(__name__)
+
+# Columns copied one-to-one between the hot and the archive table.
+ARCHIVED_FIELDS = (
+    'id', 'password', 'username', 'email', 'first_name', 'last_name',
+    'is_staff', 'is_superuser', 'is_active', 'date_joined', 'created_at',
+    'updated_at', 'last_login', 'last_logged_in',
+)
+
+
+def inactive_users(days, now=None, using=DEFAULT_DB_ALIAS):
+    """
+    Users whose most recent activity is older than ``days`` days.
+    Staff and superusers are never archived.
+    """
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    return (
+        User.objects.using(using)
+        .filter(is_staff=False, is_superuser=False)
+        .annotate(last_activity=Coalesce('last_login', 'last_logged_in', 'date_joined'))
+        .filter(last_activity__lt=cutoff)
+    )
+
+
+def archive_batch(user_ids, using=DEFAULT_DB_ALIAS):
+    """
+    Move the given users to the archive table in a single transaction.
+    Returns the number of archived users.
+    """
+    with transaction.atomic(using=using):
+        users = list(
+            User.objects.using(using).filter(pk__in=user_ids)
+            .select_for_update()
+            .prefetch_related('groups', 'user_permissions')
+        )
+        ArchivedUser.objects.using(using).bulk_create([
+            ArchivedUser(
+                **{field: getattr(user, field) for field in ARCHIVED_FIELDS},
+                group_ids=[group.pk for group in user.groups.all()],
+                permission_ids=[perm.pk for perm in user.user_permissions.all()],
+            )
+            for user in users
+        ])
+        User.objects.using(using).filter(pk__in=[user.pk for user in users]).delete()
+    return len(users)
+
+
+def archive_inactive_users(days, batch_size=500, dry_run=False, using=DEFAULT_DB_ALIAS):
+    """
+    Stream inactive users into the archive table in batches of ``batch_size``.
+    Returns the number of users archived (or that would be, for ``dry_run``).
+    """
+    candidates = inactive_users(days, using=using).order_by('pk')
+    if dry_run:
+        return candidates.count()
+
+    total = 0
+    last_pk = None
+    while True:
+        page = candidates if last_pk is None else candidates.filter(pk__gt=last_pk)
+        batch = list(page.values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            break
+        total += archive_batch(batch, using=using)
+        last_pk = batch[-1]
+    logger.info('Archived %d users inactive for more than %d days on %s', total, days, using)
+    return total
+
+
+def restore_archived_user(username, password=None):
+    """
+    Move an archived account back into the ``User`` table.
+
+    When ``password`` is given the account is only restored if it matches,
+    so failed login attempts never resurrect dormant accounts.
+    Returns the restored user, or ``None`` if there is nothing to restore,
+    the password is wrong or the username or email is in use again.
+    """
+    using = shard_for_username(username)
+    with transaction.atomic(using=using):
+        archived = (
+            ArchivedUser.objects.using(using).select_for_update()
+            .filter(username=username)
+            .first()
+        )
+        if archived is None:
+            return None
+        if password is not None and not check_password(password, archived.password):
+            return None
+
+        user = User(**{field: getattr(archived, field) for field in ARCHIVED_FIELDS})
+        try:
+            with transaction.atomic(using=using):
+                # ``save_base`` with ``raw`` keeps ``updated_at`` as archived.
+                user.save_base(using=using, raw=True, force_insert=True)
+        except IntegrityError:
+            # Only registration checks the archive, so the admin or
+            # ``create_user`` may have given the username or email away.
+            logger.warning('Cannot restore archived user %s: username or email taken', username)
+            return None
+        user.groups.set(archived.group_ids)
+        user.user_permissions.set(archived.permission_ids)
+        archived.delete()
+
+    logger.info('Restored archived user %s', username)
+    return user
+
+
+def hot_table_stats():
+    """Row counts for the hot and the archive user tables (all shards)."""
+    return {
+        'hot_users': sum(User.objects.using(alias).count() for alias in user_databases()),
+        'archived_users': sum(ArchivedUser.objects.using(alias).count() for alias in user_databases()),
+    }
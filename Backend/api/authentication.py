@@ -0,0 +1,42 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .device_sessions import is_token_revoked
+from .permission_cache import load_permission_claims
+from .sharding import get_user_by_id
+
+
+class ShardAwareJWTAuthentication(JWTAuthentication):
+    """
+    ``JWTAuthentication`` that loads the token's user from its shard via the
+    user directory instead of always querying ``default``, rejects tokens of
+    revoked device sessions and takes permissions from the token's claim.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_('Token contained no recognizable user identification')) from e
+
+        try:
+            user = get_user_by_id(user_id)
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found') from e
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+
+        if is_token_revoked(validated_token, user):
+            raise AuthenticationFailed(_('Token has been revoked'), code='token_revoked')
+
+        load_permission_claims(validated_token, user)
+
+        return user
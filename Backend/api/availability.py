@@ -0,0 +1,214 @@
+"""
+Username/email availability checks backed by an in-memory Bloom filter.
+
+The filter holds every lowercased username and email of the ``User`` and
+``ArchivedUser`` tables. A negative answer is definite for everything this
+process has seen, so most "is it free?" checks never touch the database;
+a positive answer may be a false positive and is confirmed with a query.
+
+The filter is built once per process by streaming both tables (at warm-up,
+or by the first check), and kept current by adding users as they are created
+(``post_save``, see ``api.signals``) and emails changed through the profile
+endpoint. Accounts created by other worker processes are picked up
+by a background thread that every ``AVAILABILITY_INDEX_REFRESH_INTERVAL``
+seconds adds the users created since its previous pass, a range read on the
+``created_at`` index; requests never wait for a table scan. Uniqueness is
+still enforced by the database constraints at INSERT time (for emails across
+shards, by ``api.sharding.claim_email``), and with shards email checks always
+query them, as a clash can come from any shard.
+"""
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from rest_framework import serializers
+
+from .models import User, ArchivedUser
+from .sharding import shard_for_username, sharding_enabled, user_databases
+
+logger = logging.getLogger(__name__)
+
+# Re-read this much before the previous pass, for users whose INSERT
+# committed after the pass although their ``created_at`` is older.
+REFRESH_OVERLAP = timedelta(seconds=60)
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings using double hashing. ``count`` is
+    the number of distinct values added, so adding a value again does not
+    move it closer to ``capacity``.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(int(capacity), 1)
+        self.size = max(8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, value):
+        """Set ``value``'s bits; False if they were all set already."""
+        new = False
+        for position in self._positions(value):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class AvailabilityIndex:
+    """Process-wide Bloom filter of taken usernames and emails."""
+
+    FIELDS = ('username', 'email')
+
+    def __init__(self, refresh_interval=300, min_capacity=10_000, error_rate=0.01, chunk_size=2000):
+        self.refresh_interval = refresh_interval
+        self.min_capacity = min_capacity
+        self.error_rate = error_rate
+        self.chunk_size = chunk_size
+        self._filter = None
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+        self._refresher_pid = None
+
+    @staticmethod
+    def _key(field, value):
+        return f'{field}:{value.lower()}'
+
+    def _add_rows(self, bloom, queryset, lock=None):
+        rows = queryset.values_list(*self.FIELDS).iterator(chunk_size=self.chunk_size)
+        for row in rows:
+            with lock or nullcontext():
+                for field, value in zip(self.FIELDS, row):
+                    bloom.add(self._key(field, value))
+
+    def rebuild(self):
+        """Build a fresh filter by streaming both user tables."""
+        started = timezone.now()
+        databases = user_databases()
+        total = sum(
+            model.objects.using(alias).count()
+            for model in (User, ArchivedUser) for alias in databases
+        )
+        # Leave room for growth before the next rebuild, which ``refresh``
+        # starts once more distinct values than this have been added.
+        bloom = BloomFilter(max(self.min_capacity, total * 2) * len(self.FIELDS), self.error_rate)
+        for model in (User, ArchivedUser):
+            for alias in databases:
+                self._add_rows(bloom, model.objects.using(alias))
+        self._filter = bloom
+        self._refreshed_at = started
+        return bloom
+
+    def refresh(self):
+        """
+        Add users created since the previous build or refresh. Rebuilds
+        instead once the filter holds more values than it was sized for.
+        """
+        bloom = self._filter
+        if bloom is None or bloom.count > bloom.capacity:
+            return self.rebuild()
+        started = timezone.now()
+        since = self._refreshed_at - REFRESH_OVERLAP
+        for alias in user_databases():
+            # The filter is live: take the lock that ``add`` takes.
+            self._add_rows(bloom, User.objects.using(alias).filter(created_at__gte=since), self._lock)
+        self._refreshed_at = started
+        return bloom
+
+    def _refresh_forever(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception('Refreshing the availability index failed')
+            finally:
+                connections.close_all()
+
+    def _ensure_refresher(self):
+        # Threads do not survive a fork, so every worker starts its own.
+        pid = os.getpid()
+        if self.refresh_interval and self._refresher_pid != pid:
+            self._refresher_pid = pid
+            threading.Thread(target=self._refresh_forever, name='availability-refresh', daemon=True).start()
+
+    def _current(self):
+        bloom = self._filter
+        if bloom is None:
+            with self._lock:
+                bloom = self._filter
+                if bloom is None:
+                    # Only when the process was not warmed up.
+                    bloom = self.rebuild()
+        if self._refresher_pid != os.getpid():
+            with self._lock:
+                self._ensure_refresher()
+        return bloom
+
+    def add(self, **values):
+        bloom = self._filter
+        if bloom is None:
+            return
+        # ``bits[i] |= mask`` is a read-modify-write; unlocked, two threads
+        # setting bits in the same byte can lose one of them.
+        with self._lock:
+            for field, value in values.items():
+                if value:
+                    bloom.add(self._key(field, value))
+
+    def might_be_taken(self, field, value):
+        return self._key(field, value) in self._current()
+
+    def is_taken(self, field, value):
+        """``False`` from the filter alone when possible, else ask the database."""
+        # An email may have been registered on another shard by another
+        # process since the last refresh; only the shards can tell.
+        trust_filter = field == 'username' or not sharding_enabled()
+        if trust_filter and not self.might_be_taken(field, value):
+            return False
+        lookup = {field: value}
+        # A username can only live on its own shard; emails may be anywhere.
+        databases = [shard_for_username(value)] if field == 'username' else user_databases()
+        return any(
+            model.objects.using(alias).filter(**lookup).exists()
+            for alias in databases for model in (User, ArchivedUser)
+        )
+
+
+availability_index = AvailabilityIndex(
+    refresh_interval=getattr(settings, 'AVAILABILITY_INDEX_REFRESH_INTERVAL', 300),
+)
+
+
+class AvailableValidator:
+    """Serializer field validator rejecting usernames/emails already in use."""
+
+    def __init__(self, field, message):
+        self.field = field
+        self.message = message
+
+    def __call__(self, value):
+        if availability_index.is_taken(self.field, value):
+            raise serializers.ValidationError(self.message, code='unique')
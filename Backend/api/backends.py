@@ -0,0 +1,56 @@
+from django.contrib.auth.backends import ModelBackend
+
+from .archive import restore_archived_user
+from .models import User
+from .permission_cache import cached_permissions
+from .sharding import shard_for_username, get_user_by_id
+
+
+class ArchiveAwareModelBackend(ModelBackend):
+    """
+    ``ModelBackend`` that looks users up on their shard and falls back to the
+    archive table when a username is not found, restoring the account if the
+    password matches. Permission sets come from the shared permission cache.
+    """
+
+    def _authenticate_on_shard(self, username, password):
+        manager = User._default_manager.db_manager(shard_for_username(username))
+        try:
+            user = manager.get_by_natural_key(username)
+        except User.DoesNotExist:
+            # Run the default password hasher once to reduce the timing
+            # difference between an existing and a nonexistent user.
+            User().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        user = self._authenticate_on_shard(username, password)
+        if user is not None:
+            return user
+
+        if restore_archived_user(username, password=password) is None:
+            return None
+        return self._authenticate_on_shard(username, password)
+
+    def get_user(self, user_id):
+        try:
+            user = get_user_by_id(user_id)
+        except User.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if (obj is None and user_obj.is_active and not user_obj.is_anonymous
+                and not hasattr(user_obj, '_perm_cache')):
+            user_obj._perm_cache = cached_permissions(
+                user_obj, lambda: super(ArchiveAwareModelBackend, self).get_all_permissions(user_obj),
+            )
+        return super().get_all_permissions(user_obj, obj)
@@ -0,0 +1,22 @@
+"""
+Helpers for features that coordinate worker processes through the cache.
+
+Switching the profiler on, revoking a device session or bumping a permission
+version only reaches other workers if they read the same cache. The
+development default (``LocMemCache``) keeps entries inside one process, so
+those features check ``is_process_local()`` before relying on it.
+"""
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+def is_process_local(alias=DEFAULT_CACHE_ALIAS):
+    """True if entries of cache ``alias`` are invisible to other processes."""
+    return isinstance(caches[alias], PROCESS_LOCAL_BACKENDS)
+
+
+def backend_name(alias=DEFAULT_CACHE_ALIAS):
+    return type(caches[alias]).__name__
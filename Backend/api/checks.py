@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+from .caching import backend_name, is_process_local
+
+
+@register()
+def check_permission_claims(app_configs, **kwargs):
+    if getattr(settings, 'JWT_PERMISSIONS_CLAIM', False) and is_process_local():
+        return [Warning(
+            f'JWT_PERMISSIONS_CLAIM is ignored: the default cache ({backend_name()}) is local '
+            'to each process, so a permission change could not reach the other workers.',
+            hint='Configure a shared cache backend (e.g. Redis or Memcached) in CACHES.',
+            id='api.W001',
+        )]
+    return []
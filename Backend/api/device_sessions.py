@@ -0,0 +1,140 @@
+"""
+Per-device refresh-token sessions.
+
+Every login creates a ``DeviceSession`` and its tokens carry the session id
+in a ``sid`` claim. Rotating the refresh token moves the session's
+``refresh_jti`` forward with one conditional UPDATE, so a revoked session (or
+a superseded refresh token) can no longer be refreshed.
+
+Access tokens are checked without extra queries: the user row that
+authentication loads anyway carries ``tokens_valid_after`` ("log out
+everywhere"), compared with the ``auth_us`` claim (login time in
+microseconds, kept across refreshes), and revoking a single device marks its
+``sid`` in the shared cache for the lifetime of an access token.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.contrib.auth.models import update_last_login
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_to_epoch
+
+from .permission_cache import add_permission_claims
+
+SESSION_CLAIM = 'sid'
+AUTH_TIME_CLAIM = 'auth_us'
+DEVICE_LABEL_LENGTH = 200
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def epoch_microseconds(value):
+    return (value - _EPOCH) // timedelta(microseconds=1)
+
+
+def _revoked_key(session_id):
+    return f'device-session:revoked:{session_id}'
+
+
+def device_label(request):
+    """Client-supplied ``device`` name, falling back to the User-Agent."""
+    if request is None:
+        return ''
+    label = ''
+    if hasattr(request, 'data'):
+        label = request.data.get('device') or ''
+    if not isinstance(label, str) or not label:
+        label = request.headers.get('User-Agent', '')
+    return label[:DEVICE_LABEL_LENGTH]
+
+
+def issue_tokens(user, request=None):
+    """Token pair for a new device session of ``user``."""
+    refresh = RefreshToken.for_user(user)
+    # Created on the user's database, which is the user's shard.
+    session = user.device_sessions.create(
+        device_label=device_label(request),
+        refresh_jti=refresh[api_settings.JTI_CLAIM],
+    )
+    refresh[SESSION_CLAIM] = str(session.id)
+    # ``iat`` only has whole seconds; this tells a login right after "log out
+    # everywhere" from the tokens it revoked.
+    refresh[AUTH_TIME_CLAIM] = epoch_microseconds(session.created_at)
+    access = refresh.access_token
+    add_permission_claims(access, user)
+    return {
+        'refresh': str(refresh),
+        'access': str(access),
+    }
+
+
+def is_token_revoked(payload, user):
+    """
+    True if the token was issued before the user's last "log out everywhere"
+    or belongs to a revoked device session.
+    """
+    if user.tokens_valid_after is not None:
+        auth_time = payload.get(AUTH_TIME_CLAIM)
+        if auth_time is not None:
+            if auth_time <= epoch_microseconds(user.tokens_valid_after):
+                return True
+        # Tokens without a session only have ``iat``; one from the same
+        # second as the revocation counts as revoked.
+        elif payload.get('iat', 0) <= datetime_to_epoch(user.tokens_valid_after):
+            return True
+    session_id = payload.get(SESSION_CLAIM)
+    return session_id is not None and cache.get(_revoked_key(session_id)) is not None
+
+
+def rotate_session(user, session_id, old_jti, new_jti):
+    """
+    Move the session from ``old_jti`` to ``new_jti``. Returns False if the
+    session is revoked, belongs to someone else or already moved past
+    ``old_jti``.
+    """
+    return bool(user.device_sessions.filter(
+        pk=session_id, revoked_at__isnull=True, refresh_jti=old_jti,
+    ).update(refresh_jti=new_jti, last_used_at=timezone.now()))
+
+
+def active_sessions(user):
+    return user.device_sessions.filter(revoked_at__isnull=True).order_by('-last_used_at')
+
+
+def revoke_session(user, session_id):
+    """Revoke one of the user's sessions; False if there is no such active session."""
+    revoked = user.device_sessions.filter(
+        pk=session_id, revoked_at__isnull=True,
+    ).update(revoked_at=timezone.now())
+    if revoked:
+        # Access tokens already handed out stay valid until they expire.
+        timeout = api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()
+        cache.set(_revoked_key(session_id), 1, timeout)
+    return bool(revoked)
+
+
+def revoke_all_sessions(user):
+    """
+    Log the user out everywhere: one indexed UPDATE over their sessions and a
+    watermark on the user row that rejects every token issued so far.
+    Returns the number of sessions revoked.
+    """
+    now = timezone.now()
+    revoked = user.device_sessions.filter(revoked_at__isnull=True).update(revoked_at=now)
+    type(user).objects.using(user._state.db).filter(pk=user.pk).update(tokens_valid_after=now)
+    user.tokens_valid_after = now
+    return revoked
+
+
+class SessionTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """``/api/token/`` with a device session behind every token pair."""
+
+    def validate(self, attrs):
+        # Authenticates and sets ``self.user`` without issuing tokens.
+        super(TokenObtainPairSerializer, self).validate(attrs)
+        data = issue_tokens(self.user, self.context.get('request'))
+        if api_settings.UPDATE_LAST_LOGIN:
+            update_last_login(None, self.user)
+        return data
@@ -0,0 +1,48 @@
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+_lock = threading.Lock()
+_last_ms = 0
+_last_counter = 0
+
+
+def uuid7():
+    """
+    Time-ordered UUID version 7 (RFC 9562): a 48-bit Unix timestamp in
+    milliseconds followed by random bits. The 12-bit ``rand_a`` field is used
+    as a counter so ids generated by one process are strictly increasing,
+    even within the same millisecond.
+    """
+    global _last_ms, _last_counter
+    with _lock:
+        ms = time.time_ns() // 1_000_000
+        if ms > _last_ms:
+            # Start low so the counter has room to increment.
+            counter = int.from_bytes(os.urandom(2), 'big') & 0x7FF
+        else:
+            ms = _last_ms
+            counter = _last_counter + 1
+            if counter > 0xFFF:
+                ms += 1
+                counter = 0
+        _last_ms, _last_counter = ms, counter
+
+    rand_b = int.from_bytes(os.urandom(8), 'big') & ((1 << 62) - 1)
+    value = (ms << 80) | (0x7 << 76) | (counter << 64) | (0b10 << 62) | rand_b
+    return uuid.UUID(int=value)
+
+
+def new_user_id():
+    """
+    Default primary key for new users. ``USER_ID_UUID_VERSION = 7`` gives
+    time-ordered ids that insert at the right edge of the primary key index;
+    anything else keeps random version 4 ids. Both fit the same UUIDField, so
+    existing ids stay valid either way.
+    """
+    if getattr(settings, 'USER_ID_UUID_VERSION', 4) == 7:
+        return uuid7()
+    return uuid.uuid4()
@@ -0,0 +1,148 @@
+"""
+Keyset-paginated user listing for internal services.
+
+Users are ordered by ``(created_at, id)``, which the
+``api_user_created_id_idx`` index serves directly, and the cursor is the last
+row's key, so every page costs the same no matter how deep it is. Only the
+requested fields are selected (``values()``), and with several user shards
+the per-shard results are merged in key order.
+"""
+import base64
+import heapq
+import json
+import uuid
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .models import User
+from .sharding import user_databases
+
+LISTABLE_FIELDS = (
+    'id', 'username', 'email', 'first_name', 'last_name', 'is_active',
+    'is_staff', 'created_at', 'last_login', 'last_logged_in',
+)
+CURSOR_FIELDS = ('created_at', 'id')
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class ListingError(ValueError):
+    """Invalid listing parameters; the message is safe to return to clients."""
+
+
+def parse_fields(raw):
+    if not raw:
+        return list(LISTABLE_FIELDS)
+    fields = [field.strip() for field in raw.split(',') if field.strip()]
+    unknown = sorted(set(fields) - set(LISTABLE_FIELDS))
+    if unknown:
+        raise ListingError(f'Unknown fields: {", ".join(unknown)}')
+    return list(dict.fromkeys(fields))
+
+
+def parse_limit(raw):
+    if raw is None:
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise ListingError('limit must be an integer')
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ListingError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+    return limit
+
+
+def encode_cursor(row):
+    key = [row['created_at'].isoformat(), str(row['id'])]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(created_at, str) or not isinstance(user_id, str):
+            raise TypeError('cursor values must be strings')
+        created_at = parse_datetime(created_at)
+        user_id = uuid.UUID(user_id)
+    except (ValueError, TypeError):
+        raise ListingError('Invalid cursor')
+    if created_at is None:
+        raise ListingError('Invalid cursor')
+    return created_at, user_id
+
+
+def _parse_datetime_param(params, name):
+    raw = params.get(name)
+    if raw is None:
+        return None
+    try:
+        # ``None`` if malformed, ``ValueError`` if well-formed but impossible.
+        value = parse_datetime(raw)
+    except ValueError:
+        value = None
+    if value is None:
+        raise ListingError(f'{name} must be an ISO 8601 datetime')
+    return value
+
+
+def build_filters(params):
+    """Filters restricted to indexed columns: created_at, username, email."""
+    filters = Q()
+    created_after = _parse_datetime_param(params, 'created_after')
+    created_before = _parse_datetime_param(params, 'created_before')
+    if created_after is not None:
+        filters &= Q(created_at__gte=created_after)
+    if created_before is not None:
+        filters &= Q(created_at__lt=created_before)
+    for field in ('username', 'email'):
+        if params.get(field):
+            filters &= Q(**{field: params[field]})
+
+    cursor = params.get('cursor')
+    if cursor:
+        created_at, user_id = decode_cursor(cursor)
+        filters &= Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=user_id)
+    return filters
+
+
+def _querysets(fields, filters):
+    columns = list(dict.fromkeys(fields + list(CURSOR_FIELDS)))
+    return [
+        User.objects.using(alias).filter(filters).order_by(*CURSOR_FIELDS).values(*columns)
+        for alias in user_databases()
+    ]
+
+
+def _key(row):
+    return row['created_at'], row['id']
+
+
+def _project(row, fields):
+    return {field: row[field] for field in fields}
+
+
+def list_page(params):
+    """One page of users: ``{'results': [...], 'next_cursor': str | None}``."""
+    fields = parse_fields(params.get('fields'))
+    limit = parse_limit(params.get('limit'))
+    filters = build_filters(params)
+
+    # Each shard returns at most one page; merging yields the global page.
+    pages = [list(queryset[:limit + 1]) for queryset in _querysets(fields, filters)]
+    rows = list(heapq.merge(*pages, key=_key))[:limit + 1]
+
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return {
+        'results': [_project(row, fields) for row in rows[:limit]],
+        'next_cursor': next_cursor,
+    }
+
+
+def iter_rows(params, chunk_size=2000):
+    """Every matching user, streamed from the database ``chunk_size`` rows at a time."""
+    fields = parse_fields(params.get('fields'))
+    filters = build_filters(params)
+    # Parameters are validated above, before the response starts streaming.
+    iterators = [queryset.iterator(chunk_size=chunk_size) for queryset in _querysets(fields, filters)]
+    return (_project(row, fields) for row in heapq.merge(*iterators, key=_key))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.archive import archive_inactive_users, hot_table_stats
+from api.sharding import user_databases
+
+
+class Command(BaseCommand):
+    help = 'Move users that have not logged in for DAYS days into the archive table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365,
+                            help='Inactivity threshold in days (default: 365).')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Users moved per transaction (default: 500).')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how many users would be archived.')
+        parser.add_argument('--stats', action='store_true',
+                            help='Only print hot/archive table sizes.')
+
+    def handle(self, *args, **options):
+        if not options['stats']:
+            if options['days'] < 1 or options['batch_size'] < 1:
+                raise CommandError('--days and --batch-size must be positive.')
+
+            count = sum(
+                archive_inactive_users(
+                    options['days'],
+                    batch_size=options['batch_size'],
+                    dry_run=options['dry_run'],
+                    using=alias,
+                )
+                for alias in user_databases()
+            )
+            verb = 'Would archive' if options['dry_run'] else 'Archived'
+            self.stdout.write(self.style.SUCCESS(f'{verb} {count} users.'))
+
+        stats = hot_table_stats()
+        self.stdout.write(
+            f"hot_users={stats['hot_users']} archived_users={stats['archived_users']}"
+        )
@@ -0,0 +1,76 @@
+import glob
+import os
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api import profiling
+from api.caching import backend_name, is_process_local
+
+
+class Command(BaseCommand):
+    help = (
+        'Switch request sampling on or off at runtime and merge the collected '
+        'stacks into one collapsed-stack file per view. Needs a cache shared '
+        'by all workers to reach running servers.'
+    )
+
+    def add_arguments(self, parser):
+        action = parser.add_mutually_exclusive_group(required=True)
+        action.add_argument('--enable', action='store_true', help='Start sampling requests.')
+        action.add_argument('--disable', action='store_true', help='Stop sampling requests.')
+        action.add_argument('--status', action='store_true', help='Show the current configuration.')
+        action.add_argument('--collect', action='store_true',
+                            help='Merge per-process files into <view>.collapsed.')
+        parser.add_argument('--rate', type=float, default=0.01,
+                            help='Fraction of requests to sample (default: 0.01).')
+        parser.add_argument('--duration', type=int, default=600,
+                            help='Switch off automatically after this many seconds (default: 600).')
+
+    def handle(self, *args, **options):
+        if not options['collect'] and is_process_local():
+            raise CommandError(
+                f'The default cache ({backend_name()}) is local to this process, so running '
+                'servers would never see the switch. Configure a shared cache backend '
+                '(e.g. Redis or Memcached) in CACHES.'
+            )
+        if options['enable']:
+            if not 0 < options['rate'] <= 1:
+                raise CommandError('--rate must be in (0, 1].')
+            if options['duration'] < 1:
+                raise CommandError('--duration must be at least 1 second.')
+            profiling.enable(options['rate'], options['duration'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Sampling {options['rate']:.2%} of requests for {options['duration']}s."
+            ))
+        elif options['disable']:
+            profiling.disable()
+            self.stdout.write(self.style.SUCCESS('Sampling disabled.'))
+        elif options['status']:
+            config = profiling.status()
+            self.stdout.write(f"Sampling {config['rate']:.2%} of requests." if config else 'Sampling disabled.')
+        else:
+            self.collect(getattr(settings, 'PROFILING_OUTPUT_DIR', 'profiles'))
+
+    def collect(self, directory):
+        parts = {}
+        for path in glob.glob(os.path.join(directory, '*.*.collapsed')):
+            view_name = os.path.basename(path).rsplit('.', 2)[0]
+            parts.setdefault(view_name, []).append(path)
+
+        for view_name, paths in sorted(parts.items()):
+            output = os.path.join(directory, f'{view_name}.collapsed')
+            stacks = Counter()
+            for path in [output, *paths]:
+                if not os.path.exists(path):
+                    continue
+                with open(path) as fh:
+                    for line in fh:
+                        stack, _, count = line.rstrip('\n').rpartition(' ')
+                        stacks[stack] += int(count)
+            with open(output, 'w') as fh:
+                fh.writelines(f'{stack} {count}\n' for stack, count in stacks.most_common())
+            for path in paths:
+                os.remove(path)
+            self.stdout.write(f'{output}: {sum(stacks.values())} samples')
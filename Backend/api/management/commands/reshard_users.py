@@ -0,0 +1,160 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from api.models import ArchivedUser, DeviceSession, EmailClaim, OutboxMessage, User
+from api.sharding import forget_user_shard, shard_for_username, user_databases
+
+
+class Command(BaseCommand):
+    help = (
+        'Move users (and archived users) to the shard they belong to under a new '
+        'shard list, with their device sessions and pending outbox messages, and '
+        'record every email in the cross-shard claims table. '
+        'Pause registrations and run_outbox while this runs, then set USER_SHARDS '
+        'to the new list. Safe to re-run after an interruption.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--to', required=True,
+                            help='Comma-separated database aliases of the new shard list.')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Users read per batch (default: 500).')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how many users would move.')
+
+    def handle(self, *args, **options):
+        new_shards = [alias.strip() for alias in options['to'].split(',') if alias.strip()]
+        unknown = [alias for alias in new_shards if alias not in connections.databases]
+        if not new_shards or unknown:
+            raise CommandError(f'Unknown database aliases: {", ".join(unknown) or "(none given)"}')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        sources = list(dict.fromkeys(user_databases() + new_shards))
+        kept = 0
+        for model in (User, ArchivedUser):
+            for source in sources:
+                moved, conflicts = self.reshard(model, source, new_shards, options['batch_size'], options['dry_run'])
+                verb = 'would move' if options['dry_run'] else 'moved'
+                self.stdout.write(f'{model._meta.label} on {source}: {verb} {moved}')
+                for obj, target in conflicts:
+                    self.stderr.write(
+                        f'Kept {model._meta.label} {obj.username} ({obj.pk}) on {source}: '
+                        f'conflicts with an existing row on {target}.'
+                    )
+                kept += len(conflicts)
+        if kept:
+            raise CommandError(
+                f'{kept} rows could not be moved and were left in place; '
+                f'resolve the conflicts and run the command again.'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Done. Set USER_SHARDS = {new_shards!r}.'))
+
+    def reshard(self, model, source, new_shards, batch_size, dry_run):
+        """Returns the number of moved rows and the ``(row, target)`` pairs left in place."""
+        moved = 0
+        conflicts = []
+        last_pk = None
+        queryset = model.objects.using(source).order_by('pk')
+        while True:
+            page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            batch = list(page[:batch_size])
+            if not batch:
+                return moved, conflicts
+            last_pk = batch[-1].pk
+            if not dry_run:
+                self.claim_emails(batch)
+
+            by_target = {}
+            for obj in batch:
+                target = shard_for_username(obj.username, new_shards)
+                if target != source:
+                    by_target.setdefault(target, []).append(obj)
+
+            for target, objs in by_target.items():
+                if dry_run:
+                    moved += len(objs)
+                    continue
+                copied = self.move(model, objs, source, target)
+                moved += len(copied)
+                conflicts += [(obj, target) for obj in objs if obj.pk not in copied]
+
+    def move(self, model, objs, source, target):
+        """
+        Copy ``objs`` to ``target`` and delete them from ``source``. Returns
+        the pks that are on ``target`` now; other rows stay on ``source``.
+        """
+        pks = [obj.pk for obj in objs]
+        # Copy first, then delete: an interruption leaves duplicates, which
+        # ``ignore_conflicts`` skips on the next run, never lost users.
+        with transaction.atomic(using=target):
+            model.objects.using(target).bulk_create(
+                [model(**{field.attname: getattr(obj, field.attname) for field in model._meta.concrete_fields})
+                 for obj in objs],
+                ignore_conflicts=True,
+            )
+            # ``ignore_conflicts`` also skips rows clashing with a different
+            # user (e.g. on email); only rows with the same pk and username
+            # count as copied.
+            usernames = {obj.pk: obj.username for obj in objs}
+            copied = {
+                pk for pk, username in
+                model.objects.using(target).filter(pk__in=pks).values_list('pk', 'username')
+                if usernames[pk] == username
+            }
+            if model is User:
+                # Group and permission ids must match across shards.
+                for relation in ('groups', 'user_permissions'):
+                    through = getattr(User, relation).through
+                    links = through.objects.using(source).filter(user_id__in=copied)
+                    through.objects.using(target).bulk_create(
+                        [through(**{f.attname: getattr(link, f.attname)
+                                    for f in through._meta.concrete_fields if not f.primary_key})
+                         for link in links],
+                        ignore_conflicts=True,
+                    )
+                self.copy_user_rows(copied, source, target)
+        with transaction.atomic(using=source):
+            if model is User:
+                # Sessions go with the CASCADE; delivered and failed messages
+                # are history and stay until ``run_outbox`` purges them.
+                self.pending_messages(copied, source).delete()
+            model.objects.using(source).filter(pk__in=copied).delete()
+        for pk in copied:
+            forget_user_shard(pk)
+        return copied
+
+    @staticmethod
+    def claim_emails(objs):
+        """Claims for users written before sharding was enabled."""
+        EmailClaim.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+            [EmailClaim(email=obj.email, user_id=obj.pk) for obj in objs if obj.email],
+            ignore_conflicts=True,
+        )
+
+    @staticmethod
+    def pending_messages(user_ids, using):
+        return OutboxMessage.objects.using(using).filter(user_id__in=user_ids, status=OutboxMessage.PENDING)
+
+    def copy_user_rows(self, user_ids, source, target):
+        """Copy the device sessions and pending outbox messages of ``user_ids``."""
+        sessions = DeviceSession.objects.using(source).filter(user_id__in=user_ids)
+        DeviceSession.objects.using(target).bulk_create(
+            [DeviceSession(**{f.attname: getattr(session, f.attname) for f in DeviceSession._meta.concrete_fields})
+             for session in sessions],
+            ignore_conflicts=True,
+        )
+        # Message ids are per database, so a copy gets a new one; what a
+        # previous, interrupted run already copied is recognised by content.
+        fields = [f.attname for f in OutboxMessage._meta.concrete_fields if not f.primary_key]
+        copied = Counter(self.pending_messages(user_ids, target).values_list('user_id', 'topic', 'created_at'))
+        messages = []
+        for message in self.pending_messages(user_ids, source).order_by('pk'):
+            key = (message.user_id, message.topic, message.created_at)
+            if copied[key]:
+                copied[key] -= 1
+            else:
+                messages.append(OutboxMessage(**{name: getattr(message, name) for name in fields}))
+        OutboxMessage.objects.using(target).bulk_create(messages)
@@ -0,0 +1,70 @@
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import outbox
+from api.sharding import user_databases
+
+
+class Command(BaseCommand):
+    help = (
+        'Deliver pending outbox messages (welcome emails, webhooks) in batches, '
+        'retrying failures with exponential backoff, and report throughput.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Deliver everything that is due now, then exit.')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Messages leased and delivered per batch (default: 100).')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to sleep when nothing is due (default: 1).')
+        parser.add_argument('--report-interval', type=float, default=60.0,
+                            help='Seconds between throughput reports (default: 60).')
+        parser.add_argument('--keep-days', type=int, default=7,
+                            help='Delete delivered messages older than this (default: 7).')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        databases = user_databases()
+        totals = Counter()
+        window = Counter()
+        started = window_started = time.monotonic()
+        try:
+            while True:
+                outcomes = Counter()
+                for alias in databases:
+                    outcomes += outbox.deliver_batch(alias, options['batch_size'])
+                totals += outcomes
+                window += outcomes
+
+                now = time.monotonic()
+                if now - window_started >= options['report_interval']:
+                    self.report(window, now - window_started, databases)
+                    self.purge(databases, options['keep_days'])
+                    window, window_started = Counter(), now
+
+                if not outcomes:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self.purge(databases, options['keep_days'])
+        self.report(totals, time.monotonic() - started, databases)
+
+    def purge(self, databases, keep_days):
+        for alias in databases:
+            outbox.purge_delivered(timedelta(days=keep_days), using=alias)
+
+    def report(self, outcomes, elapsed, databases):
+        rate = outcomes['delivered'] / elapsed if elapsed > 0 else 0.0
+        pending = sum(outbox.backlog(alias) for alias in databases)
+        self.stdout.write(
+            f"delivered={outcomes['delivered']} retried={outcomes['retried']} "
+            f"failed={outcomes['failed']} pending={pending} rate={rate:.1f}/s"
+        )
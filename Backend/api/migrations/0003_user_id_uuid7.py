@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:50
+
+import api.ids
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_archiveduser'),
+    ]
+
+    operations = [
+        # The default is applied in Python only, so existing rows and the
+        # column are untouched; this avoids SQLite rebuilding api_user.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='user',
+                    name='id',
+                    field=models.UUIDField(default=api.ids.new_user_id, editable=False, primary_key=True, serialize=False),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:36
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_outbox_user_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailClaim',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254, unique=True)),
+                ('user_id', models.UUIDField(unique=True)),
+                ('claimed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:40
+
+import api.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_email_claims'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', api.models.ShardAwareUserManager()),
+            ],
+        ),
+    ]
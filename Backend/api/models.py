@@ -1,14 +1,154 @@
-from django.db import models
-from django.contrib.auth.models import AbstractUser
+from django.db import DEFAULT_DB_ALIAS, models, transaction
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.utils import timezone
-import uuid
+
+from .ids import new_user_id, uuid7
+from .sharding import claim_email, shard_for_username, sharding_enabled, user_shards
+
+class ShardAwareUserManager(UserManager):
+    """
+    With ``USER_SHARDS`` set, creates and finds users by username on their
+    shard unless a shard is chosen explicitly, so ``createsuperuser`` and
+    natural-key lookups work without ``--database``. Other queries without
+    ``using()`` still go to ``default`` (see ``api.routers``).
+    """
+
+    def _username_db(self, username):
+        if sharding_enabled() and self._db not in user_shards():
+            return shard_for_username(username)
+        return self._db
+
+    def _create_user(self, username, email, password, **extra_fields):
+        user = self._create_user_object(username, email, password, **extra_fields)
+        user.save(using=self._username_db(user.username))
+        return user
+
+    async def _acreate_user(self, username, email, password, **extra_fields):
+        user = self._create_user_object(username, email, password, **extra_fields)
+        await user.asave(using=self._username_db(user.username))
+        return user
+
+    def get_by_natural_key(self, username):
+        return self.db_manager(self._username_db(username)).get(**{self.model.USERNAME_FIELD: username})
+
 
 class User(AbstractUser):
-    id = models.UUIDField(primary_key=True,default=uuid.uuid4,editable=False)
+    id = models.UUIDField(primary_key=True,default=new_user_id,editable=False)
     email= models.EmailField(unique=True)
     created_at= models.DateTimeField(default=timezone.now,editable=False)
     updated_at= models.DateTimeField(auto_now=True)
     last_logged_in= models.DateTimeField(null=True,blank=True)
+    # Tokens issued at or before this time are rejected ("log out everywhere")
+    tokens_valid_after= models.DateTimeField(null=True,blank=True,editable=False)
+
+    objects = ShardAwareUserManager()
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Keyset pagination of the user listing
+            models.Index(fields=['created_at', 'id'], name='api_user_created_id_idx'),
+        ]
 
     def __str__(self):
         return self.username
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if not sharding_enabled() or (update_fields is not None and 'email' not in update_fields):
+            return super().save(*args, **kwargs)
+        # The shard's unique constraint only covers its own users; the claim
+        # on ``default`` is released again if the row cannot be written.
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            claim_email(self.pk, self.email)
+            super().save(*args, **kwargs)
+
+
+class EmailClaim(models.Model):
+    """
+    Owner of an email address across all shards. With ``USER_SHARDS`` set,
+    every write of a user's email also writes its claim on ``default``, whose
+    unique constraint sees the users of every shard.
+    """
+    email = models.EmailField(unique=True)
+    user_id = models.UUIDField(unique=True)
+    claimed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.email
+
+
+class ArchivedUser(models.Model):
+    """
+    Cold storage for accounts that have not logged in for a long time.
+    Rows are moved here by the ``archive_inactive_users`` command and moved
+    back to ``User`` transparently on the next successful login.
+    """
+    id = models.UUIDField(primary_key=True, editable=False)
+    password = models.CharField(max_length=128)
+    username = models.CharField(max_length=150, unique=True)
+    email = models.EmailField(unique=True)
+    first_name = models.CharField(max_length=150, blank=True)
+    last_name = models.CharField(max_length=150, blank=True)
+    is_staff = models.BooleanField(default=False)
+    is_superuser = models.BooleanField(default=False)
+    is_active = models.BooleanField(default=True)
+    date_joined = models.DateTimeField()
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    last_login = models.DateTimeField(null=True, blank=True)
+    last_logged_in = models.DateTimeField(null=True, blank=True)
+    group_ids = models.JSONField(default=list, blank=True)
+    permission_ids = models.JSONField(default=list, blank=True)
+    archived_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return self.username
+
+
+class DeviceSession(models.Model):
+    """
+    One signed-in device: the family of refresh tokens that started with a
+    login, identified by the ``sid`` claim in its tokens.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='device_sessions')
+    device_label = models.CharField(max_length=200, blank=True)
+    refresh_jti = models.CharField(max_length=255)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    last_used_at = models.DateTimeField(default=timezone.now)
+    revoked_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.user} ({self.device_label or "unknown device"})'
+
+
+class OutboxMessage(models.Model):
+    """
+    A side effect (email, webhook) recorded in the same transaction as the
+    change that caused it and delivered later by ``manage.py run_outbox``.
+    """
+    PENDING = 'pending'
+    DELIVERED = 'delivered'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (DELIVERED, 'Delivered'), (FAILED, 'Failed')]
+
+    topic = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    # The user the message is about; not a foreign key, so deleting the user
+    # keeps the message, but lets ``reshard_users`` move it along.
+    user_id = models.UUIDField(null=True, blank=True, db_index=True, editable=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The worker's "what is due" query.
+            models.Index(fields=['status', 'available_at'], name='api_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.topic} #{self.pk} ({self.status})'
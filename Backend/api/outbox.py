@@ -0,0 +1,164 @@
+"""
+Transactional outbox for side effects of user changes.
+
+``enqueue()`` writes an ``OutboxMessage`` on the same database as the change
+that causes it, so with the caller's transaction both commit or neither
+does, and the request does not wait on SMTP or webhook receivers.
+``manage.py run_outbox`` delivers due messages in batches: each message is
+leased, passed to the handler registered for its topic outside of any
+transaction, and its outcome recorded; failures are retried with
+exponential backoff until ``OUTBOX_MAX_ATTEMPTS`` is reached.
+"""
+import json
+import urllib.request
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+handlers = {}
+
+
+def handler(topic):
+    """Register the function delivering messages of ``topic``."""
+    def register(fn):
+        handlers[topic] = fn
+        return fn
+    return register
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue(topic, payload, using=None, user=None):
+    """
+    Record a message; call inside the transaction of the change it belongs
+    to. Messages about a ``user`` live on the user's shard and move with it.
+    """
+    return OutboxMessage.objects.using(using or DEFAULT_DB_ALIAS).create(
+        topic=topic, payload=payload, user_id=user.pk if user is not None else None,
+    )
+
+
+def enqueue_registration(user):
+    """Welcome email and ``user.registered`` webhooks for a new user."""
+    using = user._state.db
+    enqueue('email.welcome', {'username': user.username, 'email': user.email}, using=using, user=user)
+    event = {
+        'event': 'user.registered',
+        'id': str(user.id),
+        'username': user.username,
+        'email': user.email,
+        'created_at': user.created_at.isoformat(),
+    }
+    # One message per receiver, so a failing receiver is retried on its own.
+    for url in _setting('OUTBOX_WEBHOOK_URLS', []):
+        enqueue('webhook', {'url': url, 'body': event}, using=using, user=user)
+
+
+@handler('email.welcome')
+def send_welcome_email(payload):
+    send_mail(
+        'Welcome!',
+        f"Hi {payload['username']},\n\nyour account has been created.\n",
+        None,
+        [payload['email']],
+    )
+
+
+@handler('webhook')
+def post_webhook(payload):
+    request = urllib.request.Request(
+        payload['url'],
+        data=json.dumps(payload['body']).encode(),
+        headers={'Content-Type': 'application/json'},
+        method='POST',
+    )
+    # Non-2xx responses raise HTTPError.
+    with urllib.request.urlopen(request, timeout=_setting('OUTBOX_WEBHOOK_TIMEOUT', 5)):
+        pass
+
+
+def backoff(attempts):
+    """Delay before retrying a message that has failed ``attempts`` times."""
+    base = _setting('OUTBOX_BACKOFF_BASE', 2)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), _setting('OUTBOX_BACKOFF_MAX', 3600)))
+
+
+def _claim(using, batch_size, now):
+    """
+    Lease up to ``batch_size`` due messages in one short transaction: their
+    ``available_at`` moves ``OUTBOX_LEASE_SECONDS`` ahead, which hides them
+    from other workers, and the attempt is counted up front so a message
+    that crashes the worker still runs out of attempts.
+    """
+    lease_until = now + timedelta(seconds=_setting('OUTBOX_LEASE_SECONDS', 600))
+    messages = OutboxMessage.objects.using(using)
+    due = messages.filter(status=OutboxMessage.PENDING, available_at__lte=now)
+    with transaction.atomic(using=using):
+        if connections[using].features.has_select_for_update_skip_locked:
+            pks = list(due.select_for_update(skip_locked=True)
+                       .order_by('available_at', 'pk').values_list('pk', flat=True)[:batch_size])
+            messages.filter(pk__in=pks).update(available_at=lease_until, attempts=F('attempts') + 1)
+        else:
+            # Without row locks another worker may have read the same rows;
+            # the conditional UPDATE decides who owns each one.
+            candidates = due.order_by('available_at', 'pk').values_list('pk', flat=True)[:batch_size]
+            pks = [pk for pk in list(candidates)
+                   if due.filter(pk=pk).update(available_at=lease_until, attempts=F('attempts') + 1)]
+    return list(messages.filter(pk__in=pks).order_by('pk'))
+
+
+def _deliver(message):
+    """Run the message's handler; returns the fields to record for the outcome."""
+    fn = handlers.get(message.topic)
+    now = timezone.now()
+    try:
+        if fn is None:
+            raise LookupError(f'No handler for topic {message.topic!r}')
+        fn(message.payload)
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+        if fn is None or message.attempts >= _setting('OUTBOX_MAX_ATTEMPTS', 8):
+            return 'failed', {'status': OutboxMessage.FAILED, 'last_error': error}
+        return 'retried', {'available_at': now + backoff(message.attempts), 'last_error': error}
+    return 'delivered', {'status': OutboxMessage.DELIVERED, 'delivered_at': now}
+
+
+def deliver_batch(using=DEFAULT_DB_ALIAS, batch_size=100):
+    """
+    Deliver up to ``batch_size`` due messages of one database. Returns a
+    ``Counter`` of outcomes (``delivered``, ``retried``, ``failed``).
+
+    No transaction is open while emails and webhooks are sent: messages are
+    leased first (see ``_claim``) and each outcome is written with its own
+    UPDATE. A worker that dies mid-batch leaves the undelivered rest to be
+    picked up once the lease runs out.
+    """
+    outcomes = Counter()
+    for message in _claim(using, batch_size, timezone.now()):
+        outcome, fields = _deliver(message)
+        OutboxMessage.objects.using(using).filter(pk=message.pk).update(**fields)
+        outcomes[outcome] += 1
+    return outcomes
+
+
+def backlog(using=DEFAULT_DB_ALIAS):
+    """Number of messages still waiting for delivery."""
+    return OutboxMessage.objects.using(using).filter(status=OutboxMessage.PENDING).count()
+
+
+def purge_delivered(older_than, using=DEFAULT_DB_ALIAS):
+    """Delete messages delivered more than ``older_than`` ago."""
+    cutoff = timezone.now() - older_than
+    deleted, _ = OutboxMessage.objects.using(using).filter(
+        status=OutboxMessage.DELIVERED, delivered_at__lt=cutoff,
+    ).delete()
+    return deleted
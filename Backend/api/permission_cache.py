@@ -0,0 +1,93 @@
+"""
+Versioned cache of each user's permission set.
+
+A user's permissions (``app_label.codename`` strings, as returned by
+``get_all_permissions()``) are stored in the shared cache under a key that
+includes two versions: the user's own, bumped when their groups or direct
+permissions change, and a global one, bumped when any group's permissions
+change. A bump makes every affected entry unreachable, so nothing has to be
+deleted. Signal handlers in ``api.signals`` do the bumping.
+
+With ``JWT_PERMISSIONS_CLAIM`` enabled, access tokens also carry the set
+(``perms``) and the version it was read at (``pv``); authentication trusts
+the claim while the version is current, so permission checks need neither
+a query nor a cache read of the set.
+
+Both are only used when the default cache is shared between processes: a
+version bumped in a process-local cache would leave every other worker
+serving the old set until ``PERMISSION_CACHE_TIMEOUT``. Otherwise the set is
+read from the database once per request, as Django does.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .caching import is_process_local
+
+GLOBAL_VERSION_KEY = 'perms:version'
+PERMISSIONS_CLAIM = 'perms'
+VERSION_CLAIM = 'pv'
+
+
+def _user_version_key(user_id):
+    return f'perms:version:{user_id}'
+
+
+def _new_version():
+    # Random rather than a counter, so a version evicted from the cache
+    # never comes back with a value that old entries were stored under.
+    return uuid.uuid4().hex[:12]
+
+
+def permission_version(user):
+    """Current version of ``user``'s permission set."""
+    keys = [GLOBAL_VERSION_KEY, _user_version_key(user.pk)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = _new_version()
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+            versions[key] = version
+    return f'{int(user.is_superuser)}.{versions[keys[0]]}.{versions[keys[1]]}'
+
+
+def bump_user(user_id):
+    cache.set(_user_version_key(user_id), _new_version(), None)
+
+
+def bump_all():
+    cache.set(GLOBAL_VERSION_KEY, _new_version(), None)
+
+
+def enabled():
+    return not is_process_local()
+
+
+def cached_permissions(user, compute):
+    """``user``'s permission set from the cache, filled by ``compute()`` on a miss."""
+    if not enabled():
+        return frozenset(compute())
+    key = f'perms:{user.pk}:{permission_version(user)}'
+    permissions = cache.get(key)
+    if permissions is None:
+        permissions = frozenset(compute())
+        cache.set(key, permissions, getattr(settings, 'PERMISSION_CACHE_TIMEOUT', 3600))
+    return permissions
+
+
+def add_permission_claims(token, user):
+    """Embed ``user``'s permissions in an access token if enabled."""
+    # Active superusers pass every check without looking at permissions.
+    if not getattr(settings, 'JWT_PERMISSIONS_CLAIM', False) or user.is_superuser or not enabled():
+        return
+    token[VERSION_CLAIM] = permission_version(user)
+    token[PERMISSIONS_CLAIM] = sorted(user.get_all_permissions())
+
+
+def load_permission_claims(token, user):
+    """Prime ``user``'s permission cache from a token whose claim is still current."""
+    permissions = token.get(PERMISSIONS_CLAIM)
+    if permissions is not None and enabled() and token.get(VERSION_CLAIM) == permission_version(user):
+        user._perm_cache = set(permissions)
@@ -0,0 +1,83 @@
+"""
+Profile versioning and minimal-write updates.
+
+A profile's version is its ``updated_at`` timestamp, exposed as the ETag of
+``/api/auth/profile/``. Updates write only the fields that actually change,
+in a single ``UPDATE ... WHERE id = %s AND updated_at = %s``; zero affected
+rows means someone else changed the profile since the client read it.
+"""
+from contextlib import nullcontext
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .availability import availability_index
+from .models import User
+from .sharding import claim_email, sharding_enabled
+
+EDITABLE_FIELDS = ('first_name', 'last_name', 'email')
+
+
+class VersionConflict(Exception):
+    """The profile changed since the version the client presented."""
+
+
+def profile_etag(user):
+    return f'"{user.updated_at.isoformat()}"'
+
+
+def parse_if_match(header):
+    """
+    Version from an If-Match header: ``None`` for ``*`` (any version),
+    raises ``ValueError`` if the tag is not a profile version.
+    """
+    tag = header.strip()
+    if tag == '*':
+        return None
+    if tag.startswith('W/'):
+        tag = tag[2:]
+    version = parse_datetime(tag.strip('"'))
+    if version is None:
+        raise ValueError(f'Not a profile version: {header}')
+    return version
+
+
+def changed_fields(user, data):
+    return {field: value for field, value in data.items()
+            if field in EDITABLE_FIELDS and getattr(user, field) != value}
+
+
+def update_profile(user, data, expected_version=None):
+    """
+    Apply ``data`` to ``user`` writing only changed columns. With
+    ``expected_version`` the write only happens if the stored ``updated_at``
+    still matches; otherwise ``VersionConflict`` is raised.
+    Returns the names of the changed fields.
+    """
+    changes = changed_fields(user, data)
+    if not changes:
+        if expected_version is not None and expected_version != user.updated_at:
+            raise VersionConflict()
+        return []
+
+    now = timezone.now()
+    using = user._state.db
+    queryset = User.objects.using(using).filter(pk=user.pk)
+    if expected_version is not None:
+        queryset = queryset.filter(updated_at=expected_version)
+    # With shards, a new email's claim on ``default`` commits with the UPDATE.
+    claims = transaction.atomic(using=DEFAULT_DB_ALIAS) if sharding_enabled() else nullcontext()
+    with claims, transaction.atomic(using=using):
+        if 'email' in changes:
+            claim_email(user.pk, changes['email'])
+        if not queryset.update(updated_at=now, **changes):
+            raise VersionConflict()
+
+    for field, value in changes.items():
+        setattr(user, field, value)
+    user.updated_at = now
+    # ``update()`` sends no post_save, so index a new email here.
+    if 'email' in changes:
+        availability_index.add(email=changes['email'])
+    return list(changes)
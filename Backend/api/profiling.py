@@ -0,0 +1,185 @@
+"""
+On-demand sampling profiler for live requests.
+
+``SamplingProfilerMiddleware`` is always installed but does nothing until
+profiling is switched on at runtime (``manage.py profile_requests --enable``),
+which stores the configuration in the shared cache. Workers re-read it at
+most once per ``PROFILING_CONFIG_REFRESH`` seconds, so while disabled a
+request costs one clock read and a comparison.
+
+When enabled, a fraction ``rate`` of requests is sampled: a single background
+thread snapshots the stacks of the sampled request threads every
+``PROFILING_SAMPLE_INTERVAL`` seconds. Stacks are aggregated per view
+(``register_user``, ``login_user``, ``TokenRefreshView``, ...) and appended
+to ``PROFILING_OUTPUT_DIR/<view>.<pid>.collapsed`` in the collapsed-stack
+format read by flamegraph.pl and speedscope.
+"""
+import atexit
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+CONFIG_CACHE_KEY = 'profiling:config'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class ProfilingSwitch:
+    """Process-local copy of the runtime profiling configuration."""
+
+    def __init__(self):
+        self._config = None
+        self._next_refresh = 0.0
+
+    def current(self):
+        now = time.monotonic()
+        if now >= self._next_refresh:
+            self._config = cache.get(CONFIG_CACHE_KEY)
+            self._next_refresh = now + _setting('PROFILING_CONFIG_REFRESH', 1.0)
+        return self._config
+
+    def reset(self):
+        self._next_refresh = 0.0
+
+
+def enable(rate, duration=None):
+    cache.set(CONFIG_CACHE_KEY, {'rate': rate}, timeout=duration)
+
+
+def disable():
+    cache.delete(CONFIG_CACHE_KEY)
+
+
+def status():
+    return cache.get(CONFIG_CACHE_KEY)
+
+
+def collapse(frame):
+    """``outer;...;inner`` stack string for a frame."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """One daemon thread sampling the stacks of registered threads."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._targets = {}
+        self._samples = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+            self._thread.start()
+
+    def start(self, thread_id):
+        with self._lock:
+            self._samples[thread_id] = Counter()
+            self._targets[thread_id] = True
+            self._ensure_started()
+        self._wake.set()
+
+    def stop(self, thread_id):
+        """Stop sampling a thread and return its stack counts."""
+        with self._lock:
+            self._targets.pop(thread_id, None)
+            return self._samples.pop(thread_id, Counter())
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            if not self._targets:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id in self._targets:
+                    frame = frames.get(thread_id)
+                    if frame is not None and thread_id != me:
+                        self._samples[thread_id][collapse(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+class ProfileStore:
+    """Per-view stack counts of this process, flushed to collapsed-stack files."""
+
+    def __init__(self):
+        self._stacks = defaultdict(Counter)
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def add(self, view_name, samples):
+        with self._lock:
+            stacks = self._stacks[view_name]
+            for stack, count in samples.items():
+                stacks[f'{view_name};{stack}'] += count
+
+    def flush_if_due(self):
+        if time.monotonic() - self._last_flush >= _setting('PROFILING_FLUSH_INTERVAL', 10.0):
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            stacks, self._stacks = self._stacks, defaultdict(Counter)
+            self._last_flush = time.monotonic()
+        if not stacks:
+            return
+        directory = _setting('PROFILING_OUTPUT_DIR', 'profiles')
+        os.makedirs(directory, exist_ok=True)
+        for view_name, counts in stacks.items():
+            path = os.path.join(directory, f'{view_name}.{os.getpid()}.collapsed')
+            with open(path, 'a') as fh:
+                fh.writelines(f'{stack} {count}\n' for stack, count in counts.items())
+
+
+switch = ProfilingSwitch()
+sampler = StackSampler(_setting('PROFILING_SAMPLE_INTERVAL', 0.005))
+store = ProfileStore()
+atexit.register(store.flush)
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    func = match.func
+    cls = getattr(func, 'cls', None) or getattr(func, 'view_class', None)
+    return getattr(cls, '__name__', None) or func.__name__
+
+
+class SamplingProfilerMiddleware:
+    """Samples a configurable fraction of requests while profiling is enabled."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = switch.current()
+        if config is None or random.random() >= config['rate']:
+            return self.get_response(request)
+
+        thread_id = threading.get_ident()
+        sampler.start(thread_id)
+        try:
+            return self.get_response(request)
+        finally:
+            store.add(view_name(request), sampler.stop(thread_id))
+            store.flush_if_due()
@@ -0,0 +1,148 @@
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenBackendError, TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.state import token_backend
+
+from .device_sessions import SESSION_CLAIM, is_token_revoked, rotate_session
+from .models import User
+from .permission_cache import add_permission_claims
+from .sharding import get_user_by_id
+
+
+class SingleFlight:
+    """
+    Runs a function at most once per key within a grace window.
+
+    Concurrent callers for the same key wait for the first caller and share
+    its result: threads of one process through a striped lock, processes
+    through an ``add``-based lock in the shared cache. The result is kept in
+    the cache for ``grace`` seconds so late arrivals get it as well.
+    """
+
+    def __init__(self, namespace, grace, wait_timeout=5.0, poll_interval=0.02, stripes=64):
+        self.namespace = namespace
+        self.grace = grace
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def _local_lock(self, key):
+        return self._locks[zlib.crc32(key.encode()) % len(self._locks)]
+
+    def do(self, key, fn):
+        result_key = f'{self.namespace}:result:{key}'
+        lock_key = f'{self.namespace}:lock:{key}'
+
+        result = cache.get(result_key)
+        if result is not None:
+            return result
+
+        with self._local_lock(key):
+            deadline = time.monotonic() + self.wait_timeout
+            acquired = cache.add(lock_key, 1, timeout=self.wait_timeout)
+            while not acquired:
+                result = cache.get(result_key)
+                if result is not None:
+                    return result
+                if time.monotonic() > deadline:
+                    # The holder died or is stuck; do the work ourselves.
+                    break
+                time.sleep(self.poll_interval)
+                acquired = cache.add(lock_key, 1, timeout=self.wait_timeout)
+
+            try:
+                result = cache.get(result_key)
+                if result is None:
+                    result = fn()
+                    cache.set(result_key, result, self.grace)
+            finally:
+                if acquired:
+                    cache.delete(lock_key)
+        return result
+
+
+refresh_flight = SingleFlight(
+    'token-refresh',
+    grace=getattr(settings, 'TOKEN_REFRESH_GRACE_SECONDS', 10),
+)
+
+
+class SingleFlightTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    ``TokenRefreshSerializer`` that rotates each refresh token only once.
+
+    Requests presenting the same refresh token (same ``jti``) while a rotation
+    is in flight, or shortly after it, receive the same new token pair instead
+    of rotating again and failing on the already blacklisted token.
+    """
+
+    def rotate(self, attrs):
+        """
+        ``TokenRefreshSerializer.validate`` with the user read from its shard
+        and the token's device session moved forward.
+        """
+        refresh = self.token_class(attrs['refresh'])
+
+        user = None
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM, None)
+        if user_id:
+            try:
+                user = get_user_by_id(user_id)
+            except User.DoesNotExist:
+                user = None
+            if not api_settings.USER_AUTHENTICATION_RULE(user):
+                raise AuthenticationFailed(
+                    self.error_messages['no_active_account'],
+                    'no_active_account',
+                )
+            if is_token_revoked(refresh.payload, user):
+                raise TokenError('Token has been revoked')
+
+        session_id = refresh.payload.get(SESSION_CLAIM)
+        old_jti = refresh.payload.get(api_settings.JTI_CLAIM)
+
+        access = refresh.access_token
+        if user is not None:
+            add_permission_claims(access, user)
+        data = {'access': str(access)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                try:
+                    refresh.blacklist()
+                except AttributeError:
+                    # The blacklist app is not installed.
+                    pass
+
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand()
+
+            data['refresh'] = str(refresh)
+
+        if user is not None and session_id is not None:
+            # Without rotation the jti stays put and only last_used_at moves.
+            if not rotate_session(user, session_id, old_jti, refresh[api_settings.JTI_CLAIM]):
+                raise TokenError('Token has been revoked')
+
+        return data
+
+    def validate(self, attrs):
+        try:
+            # Verifies the signature, so a forged jti never reaches the cache.
+            payload = token_backend.decode(attrs['refresh'], verify=True)
+        except TokenBackendError:
+            return self.rotate(attrs)
+
+        jti = payload.get(api_settings.JTI_CLAIM)
+        if jti is None or payload.get(api_settings.TOKEN_TYPE_CLAIM) != self.token_class.token_type:
+            return self.rotate(attrs)
+
+        return refresh_flight.do(jti, lambda: self.rotate(attrs))
@@ -0,0 +1,26 @@
+from .sharding import sharding_enabled, shard_for_username
+
+SHARDED_MODELS = {'api.user', 'api.archiveduser'}
+
+
+class UserShardRouter:
+    """
+    Places new ``User`` and ``ArchivedUser`` rows on the shard of their
+    username. Saved instances stay on the database they were loaded from
+    (Django's default for instance hints), and queries without hints go to
+    ``default``; use ``api.sharding`` to address a shard explicitly.
+    """
+
+    def _db_for_instance(self, model, **hints):
+        if not sharding_enabled() or model._meta.label_lower not in SHARDED_MODELS:
+            return None
+        instance = hints.get('instance')
+        if instance is None or instance._state.db:
+            return None
+        return shard_for_username(instance.username)
+
+    def db_for_read(self, model, **hints):
+        return self._db_for_instance(model, **hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db_for_instance(model, **hints)
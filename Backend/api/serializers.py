@@ -1,8 +1,13 @@
 from rest_framework import serializers
+from django.db import IntegrityError, transaction
+from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import update_last_login
-from rest_framework_simplejwt.tokens import RefreshToken
 from .models import User
+from .availability import AvailableValidator
+from .device_sessions import issue_tokens
+from .outbox import enqueue_registration
+from .sharding import shard_for_username
 
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -15,6 +20,17 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         fields = (
         'id', 'username', 'email', 'password', 'password_confirm', 'first_name', 'last_name', 'token', 'created_at')
         read_only_fields = ('id', 'created_at')
+        # Uniqueness is pre-checked against the in-memory availability index
+        # (which also covers archived accounts) instead of a SELECT per field.
+        extra_kwargs = {
+            'username': {'validators': [
+                UnicodeUsernameValidator(),
+                AvailableValidator('username', 'A user with that username already exists.'),
+            ]},
+            'email': {'validators': [
+                AvailableValidator('email', 'user with this email already exists.'),
+            ]},
+        }
 
     def validate(self, data):
         if data['password'] != data['password_confirm']:
@@ -24,17 +40,24 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         validated_data.pop('password_confirm')
         password = validated_data.pop('password')
-        user = User.objects.create_user(**validated_data)
-        user.set_password(password)
-        user.save()
+        try:
+            with transaction.atomic(using=shard_for_username(validated_data['username'])):
+                user = User.objects.create_user(password=password, **validated_data)
+                # Delivered by run_outbox once this transaction commits.
+                enqueue_registration(user)
+        except IntegrityError:
+            # Taken by another worker since this process last saw the table.
+            raise serializers.ValidationError('A user with that username or email already exists.')
         return user
 
     def get_token(self, obj):
-        refresh = RefreshToken.for_user(obj)
-        return {
-            'refresh': str(refresh),
-            'access': str(refresh.access_token),
-        }
+        return issue_tokens(obj, self.context.get('request'))
+
+
+class UserProfileUpdateSerializer(serializers.Serializer):
+    first_name = serializers.CharField(max_length=150, required=False, allow_blank=True)
+    last_name = serializers.CharField(max_length=150, required=False, allow_blank=True)
+    email = serializers.EmailField(max_length=254, required=False)
 
 
 class UserLoginSerializer(serializers.Serializer):
@@ -58,9 +81,4 @@ class UserLoginSerializer(serializers.Serializer):
         return data
 
     def get_token(self, obj):
-        user = obj['user']
-        refresh = RefreshToken.for_user(user)
-        return {
-            'refresh': str(refresh),
-            'access': str(refresh.access_token),
-        }
\ No newline at end of file
+        return issue_tokens(obj['user'], self.context.get('request'))
\ No newline at end of file
@@ -0,0 +1,134 @@
+"""
+Placement of users across several databases.
+
+``USER_SHARDS`` lists the database aliases that hold ``User`` rows (plus
+their group/permission links and archive rows). A user lives on the shard
+picked by a stable hash of the lowercased username, so a login goes straight
+to one database. Lookups by id (JWT authentication, token refresh) go
+through a small directory kept in the cache. With ``USER_SHARDS`` empty
+(the default) everything stays on ``default``.
+
+Every shard must be migrated and hold the same ``auth`` groups and
+permissions. Usernames are unique per shard and a username has only one
+shard; emails are made unique across shards by an ``EmailClaim`` row on
+``default`` for every user (see ``claim_email``).
+"""
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, IntegrityError
+from django.utils import timezone
+
+DIRECTORY_TIMEOUT = 24 * 60 * 60
+
+# A claim younger than this may belong to a user whose INSERT has not
+# committed yet, so it is never taken over.
+EMAIL_CLAIM_GRACE = timedelta(minutes=5)
+
+
+def user_shards():
+    return list(getattr(settings, 'USER_SHARDS', []))
+
+
+def sharding_enabled():
+    return bool(user_shards())
+
+
+def user_databases():
+    """Every database alias that may hold users."""
+    return user_shards() or [DEFAULT_DB_ALIAS]
+
+
+def normalize_username(username):
+    return username.lower()
+
+
+def shard_for_username(username, shards=None):
+    shards = shards if shards is not None else user_shards()
+    if not shards:
+        return DEFAULT_DB_ALIAS
+    digest = hashlib.blake2b(normalize_username(username).encode(), digest_size=8).digest()
+    return shards[int.from_bytes(digest, 'big') % len(shards)]
+
+
+def _directory_key(user_id):
+    return f'user-shard:{user_id}'
+
+
+def remember_user_shard(user_id, alias):
+    if sharding_enabled():
+        cache.set(_directory_key(user_id), alias, DIRECTORY_TIMEOUT)
+
+
+def forget_user_shard(user_id):
+    cache.delete(_directory_key(user_id))
+
+
+def shard_for_user_id(user_id):
+    """Database holding the user with this id, or ``None`` if there is none."""
+    from .models import User
+
+    if not sharding_enabled():
+        return DEFAULT_DB_ALIAS
+    alias = cache.get(_directory_key(user_id))
+    if alias is not None:
+        return alias
+    for alias in user_shards():
+        if User.objects.using(alias).filter(pk=user_id).exists():
+            remember_user_shard(user_id, alias)
+            return alias
+    return None
+
+
+def get_user_by_id(user_id):
+    """Fetch a user by primary key from its shard; raises ``User.DoesNotExist``."""
+    from .models import User
+
+    alias = shard_for_user_id(user_id)
+    if alias is None:
+        raise User.DoesNotExist(f'No user with id {user_id}')
+    try:
+        return User.objects.using(alias).get(pk=user_id)
+    except User.DoesNotExist:
+        # Stale directory entry (the user was moved or deleted).
+        forget_user_shard(user_id)
+        raise
+
+
+def _user_exists(user_id):
+    from .models import ArchivedUser, User
+
+    try:
+        get_user_by_id(user_id)
+        return True
+    except User.DoesNotExist:
+        return any(ArchivedUser.objects.using(alias).filter(pk=user_id).exists() for alias in user_shards())
+
+
+def claim_email(user_id, email):
+    """
+    Record ``email`` as ``user_id``'s in the claims table on ``default``;
+    raises ``IntegrityError`` if another user holds it. Run it in a
+    transaction on ``default`` that also covers the user's write.
+    """
+    from .models import EmailClaim
+
+    if not sharding_enabled() or not email:
+        return
+    claims = EmailClaim.objects.using(DEFAULT_DB_ALIAS)
+    holder = claims.filter(email=email).exclude(user_id=user_id).values_list('user_id', 'claimed_at').first()
+    if holder is not None:
+        holder_id, claimed_at = holder
+        # Claims are not removed with their user, so one whose user is gone
+        # (deleted, or its INSERT rolled back) is taken over.
+        if claimed_at > timezone.now() - EMAIL_CLAIM_GRACE or _user_exists(holder_id):
+            raise IntegrityError(f'Email {email} is claimed by user {holder_id}')
+        claims.filter(email=email, user_id=holder_id).delete()
+    # Concurrent claims of one email are decided by its unique constraint.
+    current = claims.filter(user_id=user_id).values_list('email', flat=True).first()
+    if current is None:
+        claims.create(user_id=user_id, email=email)
+    elif current != email:
+        claims.filter(user_id=user_id).update(email=email, claimed_at=timezone.now())
@@ -0,0 +1,60 @@
+from django.contrib.auth.models import Group, Permission
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from . import permission_cache
+from .availability import availability_index
+from .models import User
+from .sharding import remember_user_shard
+
+
+@receiver(post_save, sender=User)
+def add_user_to_availability_index(sender, instance, created, **kwargs):
+    # Other saves (``last_login`` on every login, admin edits) keep the
+    # values already indexed; the profile endpoint indexes email changes.
+    if created:
+        availability_index.add(username=instance.username, email=instance.email)
+
+
+@receiver(post_save, sender=User)
+def add_user_to_shard_directory(sender, instance, created, **kwargs):
+    if created:
+        remember_user_shard(instance.pk, instance._state.db)
+
+
+# Versions are bumped once the change commits; bumping earlier would let a
+# concurrent request cache the old rows under the new version.
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidate_user_permissions(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        user_ids = [instance.pk]
+    elif pk_set is not None:
+        user_ids = list(pk_set)
+    else:
+        # ``group.user_set.clear()`` does not say which users it touched.
+        transaction.on_commit(permission_cache.bump_all, using=using)
+        return
+    transaction.on_commit(lambda: [permission_cache.bump_user(pk) for pk in user_ids], using=using)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_group_permissions(sender, action, using, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(permission_cache.bump_all, using=using)
+
+
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def invalidate_deleted_permissions(sender, using, **kwargs):
+    transaction.on_commit(permission_cache.bump_all, using=using)
+
+
+@receiver(post_migrate)
+def invalidate_migrated_permissions(sender, **kwargs):
+    # Superusers hold every permission, including newly created ones.
+    permission_cache.bump_all()
@@ -1,16 +1,54 @@
+import base64
+import glob
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
 import uuid
-from django.test import TestCase, TransactionTestCase
-from django.urls import reverse
-from django.contrib.auth import get_user_model
+from collections import Counter
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, reverse
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
-from rest_framework_simplejwt.tokens import RefreshToken
-from django.db import IntegrityError
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from django.db import IntegrityError, connection
 from django.utils import timezone
 
+from Backend import settings_api
+from Backend.serving import default_workers, warm_up
+
+from . import outbox, permission_cache, profiling
+from .archive import archive_inactive_users, hot_table_stats
+from .authentication import ShardAwareJWTAuthentication
+from .availability import BloomFilter, availability_index
+from .checks import check_permission_claims
+from .ids import uuid7
+from .models import ArchivedUser, DeviceSession, EmailClaim, OutboxMessage
+from .refresh import SingleFlight
+from .routers import UserShardRouter
+from .sharding import shard_for_username
+
 User = get_user_model()
 
 
+def shared_caches(location):
+    """CACHES setting for a cache that other processes can see, as in production."""
+    return {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}}
+
+
 class UserModelTests(TestCase):
     """Tests for the User model"""
 
@@ -55,6 +93,33 @@ class UserModelTests(TestCase):
         self.assertIsInstance(user.id, uuid.UUID)
         self.assertTrue(len(str(user.id)) == 36)  # UUID string length
 
+    def test_new_ids_are_time_ordered_uuid7(self):
+        """Test that new users get increasing UUIDv7 ids"""
+        first = User.objects.create_user(**self.user_data)
+        second = User.objects.create_user(username='testuser2', email='test2@example.com', password='testpass123')
+
+        self.assertEqual(first.id.version, 7)
+        self.assertLess(first.id.hex, second.id.hex)
+
+    def test_uuid4_setting(self):
+        """Test that USER_ID_UUID_VERSION = 4 keeps random ids"""
+        with override_settings(USER_ID_UUID_VERSION=4):
+            user = User.objects.create_user(**self.user_data)
+        self.assertEqual(user.id.version, 4)
+
+    def test_uuid7_layout(self):
+        """Test the UUIDv7 version, variant and timestamp fields"""
+        before = int(time.time() * 1000)
+        ids = [uuid7() for _ in range(5000)]
+        after = int(time.time() * 1000)
+
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), len(ids))
+        for value in ids:
+            self.assertEqual(value.version, 7)
+            self.assertEqual(value.variant, uuid.RFC_4122)
+            self.assertTrue(before <= value.int >> 80 <= after + 1)
+
     def test_timestamps_auto_update(self):
         """Test that timestamps are automatically set and updated"""
         user = User.objects.create_user(**self.user_data)
@@ -161,15 +226,18 @@ class UserRegistrationTests(APITestCase):
 class UserLoginTests(APITestCase):
     """Tests for user login endpoint"""
 
-    def setUp(self):
-        self.client = APIClient()
-        self.login_url = reverse('login')
-        self.user = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
             username='testuser',
             email='test@example.com',
             password='testpass123'
         )
 
+    def setUp(self):
+        self.client = APIClient()
+        self.login_url = reverse('login')
+
     def test_successful_login(self):
         """Test successful user login"""
         data = {
@@ -237,15 +305,18 @@ class UserLoginTests(APITestCase):
 class ProtectedEndpointTests(APITestCase):
     """Tests for protected endpoints requiring JWT authentication"""
 
-    def setUp(self):
-        self.client = APIClient()
-        self.user = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
             username='testuser',
             email='test@example.com',
             password='testpass123',
             first_name='Test',
             last_name='User'
         )
+
+    def setUp(self):
+        self.client = APIClient()
         self.refresh = RefreshToken.for_user(self.user)
         self.access_token = str(self.refresh.access_token)
 
@@ -381,7 +452,7 @@ class SerializerTests(TestCase):
         self.assertIn('user', serializer.validated_data)
 
 #################################################################################
-class IntegrationTests(TransactionTestCase):
+class IntegrationTests(APITestCase):
     """Integration tests for complete user flows"""
 
     def setUp(self):
@@ -424,14 +495,17 @@ class IntegrationTests(TransactionTestCase):
 class SecurityTests(APITestCase):
     """Security-focused tests"""
 
-    def setUp(self):
-        self.client = APIClient()
-        self.user = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
             username='securityuser',
             email='security@example.com',
             password='securepass123'
         )
 
+    def setUp(self):
+        self.client = APIClient()
+
     def test_password_not_returned_in_response(self):
         """Test that passwords are never returned in API responses"""
         register_data = {
@@ -498,3 +572,1059 @@ class PerformanceTests(APITestCase):
 
         # Assert that it doesn't take unreasonably long (adjust threshold as needed)
         self.assertLess(duration, 5.0)  # Should complete within 5 seconds
+
+#################################################################################
+
+class ArchiveTests(APITestCase):
+    """Tests for archiving inactive users and restoring them on login"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.group = Group.objects.create(name='editors')
+        cls.dormant = User.objects.create_user(
+            username='dormant',
+            email='dormant@example.com',
+            password='testpass123'
+        )
+        cls.dormant.groups.add(cls.group)
+        User.objects.filter(pk=cls.dormant.pk).update(
+            last_login=timezone.now() - timezone.timedelta(days=400)
+        )
+        cls.active = User.objects.create_user(
+            username='active',
+            email='active@example.com',
+            password='testpass123'
+        )
+        User.objects.filter(pk=cls.active.pk).update(last_login=timezone.now())
+
+    def test_archive_moves_only_inactive_users(self):
+        """Test that only users past the threshold are archived"""
+        self.assertEqual(archive_inactive_users(365, batch_size=1, dry_run=True), 1)
+        self.assertEqual(archive_inactive_users(365, batch_size=1), 1)
+
+        self.assertFalse(User.objects.filter(username='dormant').exists())
+        archived = ArchivedUser.objects.get(username='dormant')
+        self.assertEqual(archived.id, self.dormant.id)
+        self.assertEqual(archived.group_ids, [self.group.pk])
+        self.assertEqual(hot_table_stats(), {'hot_users': 1, 'archived_users': 1})
+
+    def test_login_restores_archived_user(self):
+        """Test that a successful login transparently restores the account"""
+        archive_inactive_users(365)
+
+        response = self.client.post(reverse('login'), {'username': 'dormant', 'password': 'testpass123'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        restored = User.objects.get(username='dormant')
+        self.assertEqual(restored.id, self.dormant.id)
+        self.assertEqual(list(restored.groups.all()), [self.group])
+        self.assertFalse(ArchivedUser.objects.exists())
+
+    def test_wrong_password_does_not_restore(self):
+        """Test that failed logins leave the account archived"""
+        archive_inactive_users(365)
+
+        response = self.client.post(reverse('login'), {'username': 'dormant', 'password': 'wrong'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(User.objects.filter(username='dormant').exists())
+
+    def test_restore_conflict_fails_login_cleanly(self):
+        """Test that an email taken outside registration blocks the restore without a 500"""
+        archive_inactive_users(365)
+        User.objects.create_user('newcomer', 'dormant@example.com', 'testpass123')
+
+        with self.assertLogs('api.archive', level='WARNING'):
+            response = self.client.post(reverse('login'), {'username': 'dormant', 'password': 'testpass123'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(User.objects.filter(username='dormant').exists())
+        self.assertTrue(ArchivedUser.objects.filter(username='dormant').exists())
+
+    def test_archived_username_cannot_be_registered(self):
+        """Test that archived usernames stay reserved"""
+        archive_inactive_users(365)
+
+        response = self.client.post(reverse('register'), {
+            'username': 'dormant',
+            'email': 'other@example.com',
+            'password': 'testpass123',
+            'password_confirm': 'testpass123'
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('username', response.data)
+
+#################################################################################
+
+class ServingTests(TestCase):
+    """Tests for the production server sizing and warm-up helpers"""
+
+    def test_worker_count_scales_with_hashing_load(self):
+        """Test that hashing-heavy traffic gets fewer workers per core"""
+        self.assertEqual(default_workers(cpu_count=4, hashing_load=0), 9)
+        self.assertEqual(default_workers(cpu_count=4, hashing_load=1), 5)
+        self.assertGreaterEqual(default_workers(cpu_count=1, hashing_load=1), 2)
+
+    def test_warm_up(self):
+        """Test that warm-up initialises the lazily built state"""
+        warm_up()
+        self.assertTrue(get_resolver()._populated)
+
+    def test_api_settings_profile_drops_admin_only_apps(self):
+        """Test that the API-only profile keeps the API but not the admin"""
+        self.assertNotIn('django.contrib.admin', settings_api.INSTALLED_APPS)
+        self.assertNotIn('django.contrib.staticfiles', settings_api.INSTALLED_APPS)
+        self.assertIn('api', settings_api.INSTALLED_APPS)
+        self.assertEqual(settings_api.TEMPLATES, [])
+        self.assertEqual(settings_api.ROOT_URLCONF, 'Backend.urls_api')
+
+#################################################################################
+
+class TokenRefreshSingleFlightTests(APITestCase):
+    """Tests for single-flight refresh token rotation"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='refreshuser',
+            email='refresh@example.com',
+            password='testpass123'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('token_refresh')
+
+    def test_repeated_refresh_shares_rotation(self):
+        """Test that the same refresh token rotates only once within the grace window"""
+        refresh = str(RefreshToken.for_user(self.user))
+
+        first = self.client.post(self.url, {'refresh': refresh})
+        second = self.client.post(self.url, {'refresh': refresh})
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data, second.data)
+        self.assertNotEqual(first.data['refresh'], refresh)
+
+    def test_different_tokens_rotate_independently(self):
+        """Test that distinct refresh tokens do not share results"""
+        first = self.client.post(self.url, {'refresh': str(RefreshToken.for_user(self.user))})
+        second = self.client.post(self.url, {'refresh': str(RefreshToken.for_user(self.user))})
+
+        self.assertNotEqual(first.data['refresh'], second.data['refresh'])
+
+    def test_invalid_token_rejected(self):
+        """Test that forged tokens still fail"""
+        response = self.client.post(self.url, {'refresh': 'invalid_token'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_concurrent_callers_run_once(self):
+        """Test that concurrent calls for one key execute the function once"""
+        flight = SingleFlight('test-flight', grace=5)
+        calls = []
+        barrier = threading.Barrier(8)
+
+        def rotate():
+            calls.append(1)
+            time.sleep(0.05)
+            return {'refresh': 'new'}
+
+        results = []
+
+        def worker():
+            barrier.wait()
+            results.append(flight.do('same-jti', rotate))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'refresh': 'new'}] * 8)
+
+#################################################################################
+
+class AvailabilityTests(APITestCase):
+    """Tests for the username/email availability index and endpoint"""
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user(
+            username='takenuser',
+            email='taken@example.com',
+            password='testpass123'
+        )
+
+    def setUp(self):
+        self.url = reverse('check-availability')
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        """Test that every added value is reported as present"""
+        bloom = BloomFilter(1000)
+        values = [f'user{i}' for i in range(1000)]
+        for value in values:
+            bloom.add(value)
+
+        self.assertTrue(all(value in bloom for value in values))
+        false_positives = sum(f'other{i}' in bloom for i in range(1000))
+        self.assertLess(false_positives, 50)
+
+    def test_taken_and_free_names(self):
+        """Test the availability endpoint for taken and free values"""
+        response = self.client.get(self.url, {'username': 'takenuser', 'email': 'free@example.com'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data['username']['available'])
+        self.assertTrue(response.data['email']['available'])
+
+    def test_new_users_are_indexed(self):
+        """Test that users created after the index was built are seen"""
+        availability_index.rebuild()
+
+        self.client.post(reverse('register'), {
+            'username': 'freshuser',
+            'email': 'fresh@example.com',
+            'password': 'testpass123',
+            'password_confirm': 'testpass123'
+        })
+
+        self.assertTrue(availability_index.might_be_taken('username', 'FreshUser'))
+        response = self.client.get(self.url, {'username': 'freshuser'})
+        self.assertFalse(response.data['username']['available'])
+
+    def test_free_name_skips_database(self):
+        """Test that a definite miss is answered without a query"""
+        availability_index.rebuild()
+
+        with self.assertNumQueries(0):
+            self.assertFalse(availability_index.is_taken('username', 'nobody-has-this-name'))
+
+    def test_refresh_reads_only_new_users(self):
+        """Test that users created by other workers are added without a full rebuild"""
+        availability_index.rebuild()
+        bloom = availability_index._filter
+        # ``bulk_create`` sends no post_save, like an INSERT in another process.
+        User.objects.bulk_create([User(username='elsewhere', email='elsewhere@example.com')])
+
+        with self.assertNumQueries(1):
+            availability_index.refresh()
+
+        self.assertIs(availability_index._filter, bloom)
+        self.assertTrue(availability_index.might_be_taken('username', 'elsewhere'))
+        self.assertTrue(availability_index.might_be_taken('email', 'elsewhere@example.com'))
+
+    def test_count_tracks_distinct_values(self):
+        """Test that logins and overlapping refreshes do not push the index towards a rebuild"""
+        availability_index.rebuild()
+        bloom = availability_index._filter
+        count = bloom.count
+
+        for _ in range(3):
+            self.client.post(reverse('login'), {'username': 'takenuser', 'password': 'testpass123'})
+            availability_index.refresh()
+
+        self.assertIs(availability_index._filter, bloom)
+        self.assertEqual(bloom.count, count)
+        self.assertTrue(bloom.add('value'))
+        self.assertFalse(bloom.add('value'))
+        self.assertEqual(bloom.count, count + 1)
+
+    def test_check_does_not_rebuild_built_index(self):
+        """Test that availability checks never scan the tables once the index exists"""
+        availability_index.rebuild()
+        availability_index._refreshed_at -= timezone.timedelta(days=1)
+
+        with self.assertNumQueries(0):
+            availability_index.might_be_taken('username', 'someone')
+
+    def test_missing_parameters(self):
+        """Test that at least one value is required"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+#################################################################################
+
+class ShardingTests(APITestCase):
+    """
+    Tests for user sharding. The multi-database tests run with
+    ``python manage.py test api.tests.ShardingTests --settings=Backend.settings_sharded``.
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+
+    def test_shard_for_username_is_stable_and_spread(self):
+        """Test that usernames map to a stable, case-insensitive shard"""
+        shards = ['a', 'b', 'c']
+        self.assertEqual(shard_for_username('Alice', shards), shard_for_username('alice', shards))
+        counts = Counter(shard_for_username(f'user{i}', shards) for i in range(3000))
+        self.assertEqual(set(counts), set(shards))
+        self.assertTrue(all(count > 800 for count in counts.values()))
+
+    def test_router_places_new_users_by_username(self):
+        """Test that the router only routes unsaved users when sharding is on"""
+        router = UserShardRouter()
+        user = User(username='placed')
+        with override_settings(USER_SHARDS=[]):
+            self.assertIsNone(router.db_for_write(User, instance=user))
+        with override_settings(USER_SHARDS=['default', 'other']):
+            self.assertEqual(router.db_for_write(User, instance=user), shard_for_username('placed'))
+            user._state.db = 'default'
+            self.assertIsNone(router.db_for_write(User, instance=user))
+
+    def _require_shards(self):
+        if len(settings.USER_SHARDS) < 2:
+            self.skipTest('Run with --settings=Backend.settings_sharded')
+
+    def test_register_login_and_profile_across_shards(self):
+        """Test the full auth flow for users living on different shards"""
+        self._require_shards()
+
+        for i in range(6):
+            username = f'sharded{i}'
+            response = self.client.post(reverse('register'), {
+                'username': username,
+                'email': f'{username}@example.com',
+                'password': 'testpass123',
+                'password_confirm': 'testpass123'
+            })
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertTrue(User.objects.using(shard_for_username(username)).filter(username=username).exists())
+
+            login = self.client.post(reverse('login'), {'username': username, 'password': 'testpass123'})
+            self.assertEqual(login.status_code, status.HTTP_200_OK)
+
+            self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {login.data['token']['access']}")
+            profile = self.client.get(reverse('user-profile'))
+            self.assertEqual(profile.data['user']['username'], username)
+            self.client.credentials()
+
+            refresh = self.client.post(reverse('token_refresh'), {'refresh': login.data['token']['refresh']})
+            self.assertEqual(refresh.status_code, status.HTTP_200_OK)
+
+    def test_reshard_moves_users(self):
+        """Test that resharding places every user on its new shard"""
+        self._require_shards()
+
+        new_shards = settings.USER_SHARDS
+        old_shards = new_shards[:1]
+        with override_settings(USER_SHARDS=old_shards):
+            for i in range(20):
+                User.objects.create_user(f'move{i}', f'move{i}@example.com', 'testpass123')
+
+        with override_settings(USER_SHARDS=old_shards):
+            call_command('reshard_users', to=','.join(new_shards), batch_size=7, stdout=StringIO())
+
+        for i in range(20):
+            username = f'move{i}'
+            self.assertTrue(User.objects.using(shard_for_username(username)).filter(username=username).exists())
+        total = sum(User.objects.using(alias).filter(username__startswith='move').count()
+                    for alias in new_shards)
+        self.assertEqual(total, 20)
+
+    def test_reshard_moves_sessions_and_pending_messages(self):
+        """Test that device sessions and undelivered messages move with their user"""
+        self._require_shards()
+
+        new_shards = settings.USER_SHARDS
+        source = new_shards[0]
+        username = next(f'mobile{i}' for i in range(100) if shard_for_username(f'mobile{i}', new_shards) != source)
+        target = shard_for_username(username, new_shards)
+        with override_settings(USER_SHARDS=[source]):
+            response = self.client.post(reverse('register'), {
+                'username': username,
+                'email': f'{username}@example.com',
+                'password': 'testpass123',
+                'password_confirm': 'testpass123'
+            })
+            user = User.objects.using(source).get(username=username)
+            delivered = outbox.enqueue('email.welcome', {}, using=source, user=user)
+            OutboxMessage.objects.using(source).filter(pk=delivered.pk).update(status=OutboxMessage.DELIVERED)
+            call_command('reshard_users', to=','.join(new_shards), stdout=StringIO())
+
+        self.assertEqual(list(DeviceSession.objects.using(target).filter(user_id=user.pk)
+                              .values_list('refresh_jti', flat=True)),
+                         [RefreshToken(response.data['token']['refresh'])['jti']])
+        pending = OutboxMessage.objects.using(target).filter(user_id=user.pk)
+        self.assertEqual([(m.topic, m.status) for m in pending], [('email.welcome', OutboxMessage.PENDING)])
+        self.assertEqual(list(OutboxMessage.objects.using(source).filter(user_id=user.pk)), [delivered])
+
+        refresh = self.client.post(reverse('token_refresh'), {'refresh': response.data['token']['refresh']})
+        self.assertEqual(refresh.status_code, status.HTTP_200_OK)
+
+    def test_email_unique_across_shards(self):
+        """Test that an email taken on one shard cannot be used on another"""
+        self._require_shards()
+
+        first, second = 'owner', next(f'other{i}' for i in range(100)
+                                      if shard_for_username(f'other{i}') != shard_for_username('owner'))
+        owner = User.objects.create_user(first, 'dup@example.com', 'testpass123')
+        with self.assertRaises(IntegrityError):
+            User.objects.create_user(second, 'dup@example.com', 'testpass123')
+
+        data = {'username': second, 'email': 'dup@example.com',
+                'password': 'testpass123', 'password_confirm': 'testpass123'}
+        self.assertEqual(self.client.post(reverse('register'), data).status_code, status.HTTP_400_BAD_REQUEST)
+        # Even when the check misses a registration made elsewhere.
+        with mock.patch.object(availability_index, 'is_taken', return_value=False):
+            self.assertEqual(self.client.post(reverse('register'), data).status_code, status.HTTP_400_BAD_REQUEST)
+
+        other = User.objects.create_user(second, 'other@example.com', 'testpass123')
+        self.client.force_authenticate(other)
+        response = self.client.patch(reverse('user-profile'), {'email': 'dup@example.com'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(User.objects.using(other._state.db).get(pk=other.pk).email, 'other@example.com')
+
+        # A claim left behind by a deleted user is taken over.
+        owner_id = owner.pk
+        owner.delete()
+        EmailClaim.objects.filter(user_id=owner_id).update(claimed_at=timezone.now() - timezone.timedelta(hours=1))
+        response = self.client.patch(reverse('user-profile'), {'email': 'dup@example.com'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertEqual(EmailClaim.objects.get(email='dup@example.com').user_id, other.pk)
+
+    def test_reshard_claims_existing_emails(self):
+        """Test that users from before sharding get their email claims"""
+        self._require_shards()
+
+        shards = settings.USER_SHARDS
+        with override_settings(USER_SHARDS=[]):
+            user = User.objects.create_user('unsharded', 'unsharded@example.com', 'testpass123')
+            self.assertFalse(EmailClaim.objects.exists())
+            call_command('reshard_users', to=','.join(shards), stdout=StringIO())
+
+        self.assertEqual(EmailClaim.objects.get(email='unsharded@example.com').user_id, user.pk)
+        with self.assertRaises(IntegrityError):
+            User.objects.create_user(next(f'u{i}' for i in range(100) if shard_for_username(f'u{i}') !=
+                                          shard_for_username('unsharded')), 'unsharded@example.com', 'x')
+
+    def test_user_manager_uses_username_shard(self):
+        """Test that creating and fetching users by username finds their shard"""
+        self._require_shards()
+
+        with mock.patch.dict(os.environ, {'DJANGO_SUPERUSER_PASSWORD': 'testpass123'}):
+            call_command('createsuperuser', interactive=False, username='rootuser',
+                         email='root@example.com', stdout=StringIO())
+        shard = shard_for_username('rootuser')
+        self.assertTrue(User.objects.using(shard).filter(username='rootuser', is_superuser=True).exists())
+        self.assertEqual(User.objects.get_by_natural_key('rootuser')._state.db, shard)
+        self.assertEqual(User.objects.db_manager('default').get_by_natural_key('rootuser')._state.db, shard)
+
+    def test_admin_reads_every_shard(self):
+        """Test that the admin lists users per shard and finds any user"""
+        self._require_shards()
+
+        admin_user = User.objects.create_superuser('adminuser', 'admin@example.com', 'testpass123')
+        users = [User.objects.create_user(f'staffed{i}', f'staffed{i}@example.com', 'testpass123')
+                 for i in range(6)]
+        self.client.force_login(admin_user)
+
+        for alias in settings.USER_SHARDS:
+            response = self.client.get(reverse('admin:api_user_changelist'), {'shard': alias})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            listed = {user.username for user in response.context['cl'].result_list}
+            self.assertEqual(listed, set(User.objects.using(alias).values_list('username', flat=True)))
+
+        for user in users:
+            response = self.client.get(reverse('admin:api_user_change', args=[user.pk]))
+            self.assertContains(response, user.username)
+
+        victim = users[0]
+        response = self.client.post(reverse('admin:api_user_delete', args=[victim.pk]), {'post': 'yes'})
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertFalse(User.objects.using(victim._state.db).filter(pk=victim.pk).exists())
+
+    def test_reshard_keeps_conflicting_users(self):
+        """Test that a user whose copy is rejected by the target is not deleted"""
+        self._require_shards()
+
+        new_shards = settings.USER_SHARDS
+        source = new_shards[0]
+        username = next(f'clash{i}' for i in range(100) if shard_for_username(f'clash{i}', new_shards) != source)
+        target = shard_for_username(username, new_shards)
+        with override_settings(USER_SHARDS=[source]):
+            user = User.objects.create_user(username, 'clash@example.com', 'testpass123')
+            User.objects.create_user('mover', 'mover@example.com', 'testpass123')
+        # A duplicate from before email claims existed; ``save()`` would refuse it.
+        User.objects.using(target).bulk_create([User(username='squatter', email='clash@example.com')])
+
+        err = StringIO()
+        with override_settings(USER_SHARDS=[source]), self.assertRaises(CommandError):
+            call_command('reshard_users', to=','.join(new_shards), stdout=StringIO(), stderr=err)
+
+        self.assertTrue(User.objects.using(source).filter(pk=user.pk).exists())
+        self.assertFalse(User.objects.using(target).filter(username=username).exists())
+        self.assertIn(username, err.getvalue())
+        mover_shard = shard_for_username('mover', new_shards)
+        self.assertTrue(User.objects.using(mover_shard).filter(username='mover').exists())
+        self.assertEqual(sum(User.objects.using(alias).filter(username='mover').count()
+                             for alias in new_shards), 1)
+
+#################################################################################
+
+class UserListingTests(APITestCase):
+    """Tests for the staff-only user listing endpoint"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(
+            username='staffuser',
+            email='staff@example.com',
+            password='testpass123',
+            is_staff=True
+        )
+        for i in range(5):
+            User.objects.create_user(f'listed{i}', f'listed{i}@example.com', 'testpass123')
+
+    def setUp(self):
+        self.url = reverse('user-list')
+        self.client.force_authenticate(self.staff)
+
+    def test_requires_staff(self):
+        """Test that regular users cannot list users"""
+        regular = User.objects.get(username='listed0')
+        self.client.force_authenticate(regular)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_cursor_pagination_walks_all_users(self):
+        """Test that following next_cursor returns every user exactly once"""
+        seen = []
+        params = {'limit': 2, 'fields': 'id,username'}
+        while True:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen += [row['username'] for row in response.data['results']]
+            if not response.data['next_cursor']:
+                break
+            params['cursor'] = response.data['next_cursor']
+
+        expected = list(User.objects.order_by('created_at', 'id').values_list('username', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor(self):
+        """Test that malformed or tampered cursors are rejected with 400"""
+        def encode(value):
+            return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+        for cursor in ['not-a-cursor', encode(['2024-01-01T00:00:00+00:00', 5]),
+                       encode([5, str(uuid.uuid4())]), encode(['2024-01-01T00:00:00+00:00', 'nope']),
+                       encode(['2024-13-45T00:00:00', str(uuid.uuid4())]), encode({'a': 1})]:
+            response = self.client.get(self.url, {'cursor': cursor})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, cursor)
+
+    def test_sparse_fieldsets(self):
+        """Test that only the requested fields are returned"""
+        response = self.client.get(self.url, {'fields': 'id,email'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'email'})
+
+        response = self.client.get(self.url, {'fields': 'password'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filters(self):
+        """Test filtering on indexed columns"""
+        response = self.client.get(self.url, {'email': 'listed3@example.com', 'fields': 'username'})
+        self.assertEqual(response.data['results'], [{'username': 'listed3'}])
+
+        response = self.client.get(self.url, {'created_after': 'not-a-date'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(self.url, {'created_after': '2024-13-45T00:00:00'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_ndjson_stream(self):
+        """Test the streaming NDJSON export"""
+        response = self.client.get(self.url, {'stream': 'ndjson', 'fields': 'username'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), User.objects.count())
+        self.assertEqual(set(json.loads(lines[0])), {'username'})
+
+#################################################################################
+
+class ProfileUpdateTests(APITestCase):
+    """Tests for PATCH /api/auth/profile/ with optimistic concurrency"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='profileuser',
+            email='profile@example.com',
+            password='testpass123',
+            first_name='Old'
+        )
+
+    def setUp(self):
+        self.url = reverse('user-profile')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def test_update_with_matching_version(self):
+        """Test that a PATCH with the current ETag updates only changed fields"""
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.patch(self.url, {'first_name': 'New', 'last_name': ''}, HTTP_IF_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['user']['first_name'], 'New')
+        self.assertNotEqual(response['ETag'], etag)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'New')
+
+    def test_single_conditional_update(self):
+        """Test that the write is one conditional UPDATE"""
+        etag = self.client.get(self.url)['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.patch(self.url, {'first_name': 'New'}, HTTP_IF_MATCH=etag)
+
+        writes = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(writes), 1)
+        self.assertIn('"first_name"', writes[0])
+        self.assertNotIn('"last_name"', writes[0])
+        self.assertIn('"updated_at" =', writes[0].split('WHERE')[1])
+
+    def test_stale_version_is_rejected(self):
+        """Test that a concurrent edit is detected"""
+        etag = self.client.get(self.url)['ETag']
+        self.client.patch(self.url, {'first_name': 'First'}, HTTP_IF_MATCH=etag)
+
+        response = self.client.patch(self.url, {'first_name': 'Second'}, HTTP_IF_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'First')
+
+    def test_unchanged_values_do_not_write(self):
+        """Test that a no-op PATCH leaves updated_at alone"""
+        before = self.user.updated_at
+        response = self.client.patch(self.url, {'first_name': 'Old'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.updated_at, before)
+
+    def test_duplicate_email_rejected(self):
+        """Test that another user's email cannot be taken"""
+        User.objects.create_user('other', 'other@example.com', 'testpass123')
+        response = self.client.patch(self.url, {'email': 'other@example.com'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('email', response.data)
+
+    def test_if_none_match_returns_not_modified(self):
+        """Test that a cached profile is revalidated with its ETag"""
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+#################################################################################
+
+class ProfilingTests(APITestCase):
+    """Tests for the on-demand sampling profiler"""
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user('profiled', 'profiled@example.com', 'testpass123')
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        # The switch only works through a cache shared by all processes.
+        self.enterContext(override_settings(CACHES=shared_caches(os.path.join(self.output_dir, 'cache'))))
+        profiling.switch.reset()
+
+    def tearDown(self):
+        profiling.disable()
+        profiling.switch.reset()
+        shutil.rmtree(self.output_dir)
+
+    def test_process_local_cache_refused(self):
+        """Test that the switch fails loudly when the cache is not shared"""
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            with self.assertRaisesMessage(CommandError, 'LocMemCache'):
+                call_command('profile_requests', enable=True, stdout=StringIO())
+            call_command('profile_requests', collect=True, stdout=StringIO())
+
+    def test_duration_validated(self):
+        """Test that --duration must be at least one second"""
+        for duration in (0, -5):
+            with self.assertRaisesMessage(CommandError, '--duration'):
+                call_command('profile_requests', enable=True, duration=duration, stdout=StringIO())
+        self.assertIsNone(profiling.status())
+
+    def test_disabled_profiler_samples_nothing(self):
+        """Test that requests are not sampled while profiling is off"""
+        self.client.post(reverse('login'), {'username': 'profiled', 'password': 'testpass123'})
+
+        self.assertEqual(profiling.sampler._targets, {})
+        self.assertEqual(dict(profiling.store._stacks), {})
+
+    def test_enabled_profiler_writes_collapsed_stacks_per_view(self):
+        """Test that sampled requests produce per-view collapsed stacks"""
+        def slow_authenticate(**credentials):
+            # The test hasher is too fast for the sampler to catch the request.
+            time.sleep(0.05)
+            return authenticate(**credentials)
+
+        with override_settings(PROFILING_OUTPUT_DIR=self.output_dir, PROFILING_SAMPLE_INTERVAL=0.001), \
+                mock.patch('api.serializers.authenticate', slow_authenticate):
+            call_command('profile_requests', enable=True, rate=1.0, stdout=StringIO())
+            profiling.switch.reset()
+            self.client.post(reverse('login'), {'username': 'profiled', 'password': 'testpass123'})
+            profiling.store.flush()
+            call_command('profile_requests', collect=True, stdout=StringIO())
+
+        path = os.path.join(self.output_dir, 'login_user.collapsed')
+        self.assertEqual(glob.glob(os.path.join(self.output_dir, '*.collapsed')), [path])
+        with open(path) as fh:
+            lines = fh.read().splitlines()
+        self.assertTrue(lines)
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertTrue(stack.startswith('login_user;'))
+        self.assertGreater(int(count), 0)
+
+#################################################################################
+
+class DeviceSessionTests(APITestCase):
+    """Tests for per-device sessions and revocation"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('deviceuser', 'device@example.com', 'testpass123')
+
+    def setUp(self):
+        cache.clear()
+
+    def login(self, device):
+        response = self.client.post(reverse('login'), {
+            'username': 'deviceuser', 'password': 'testpass123', 'device': device,
+        })
+        return response.data['token']
+
+    def authorize(self, tokens):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}')
+
+    def test_login_creates_session_per_device(self):
+        """Test that each login is listed as its own device session"""
+        laptop = self.login('laptop')
+        self.login('phone')
+        self.authorize(laptop)
+
+        response = self.client.get(reverse('session-list'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        sessions = response.data['sessions']
+        self.assertEqual({s['device_label'] for s in sessions}, {'laptop', 'phone'})
+        current = [s['device_label'] for s in sessions if s['current']]
+        self.assertEqual(current, ['laptop'])
+
+    def test_refresh_moves_session_forward(self):
+        """Test that a superseded refresh token cannot be used once the grace window ends"""
+        tokens = self.login('laptop')
+
+        response = self.client.post(reverse('token_refresh'), {'refresh': tokens['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        cache.clear()
+
+        replay = self.client.post(reverse('token_refresh'), {'refresh': tokens['refresh']})
+        self.assertEqual(replay.status_code, status.HTTP_401_UNAUTHORIZED)
+        rotated = self.client.post(reverse('token_refresh'), {'refresh': response.data['refresh']})
+        self.assertEqual(rotated.status_code, status.HTTP_200_OK)
+
+    def test_revoke_single_session(self):
+        """Test that revoking one device leaves the others signed in"""
+        laptop = self.login('laptop')
+        phone = self.login('phone')
+        self.authorize(laptop)
+        phone_id = next(s['id'] for s in self.client.get(reverse('session-list')).data['sessions']
+                        if s['device_label'] == 'phone')
+
+        response = self.client.delete(reverse('session-detail', args=[phone_id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        self.assertEqual(self.client.get(reverse('user-profile')).status_code, status.HTTP_200_OK)
+        refresh = self.client.post(reverse('token_refresh'), {'refresh': phone['refresh']})
+        self.assertEqual(refresh.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.authorize(phone)
+        self.assertEqual(self.client.get(reverse('user-profile')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoke_unknown_session(self):
+        """Test that another user's or a missing session is not found"""
+        other = User.objects.create_user('otherdevice', 'other@example.com', 'testpass123')
+        other_session = other.device_sessions.create(refresh_jti='x')
+        self.authorize(self.login('laptop'))
+
+        response = self.client.delete(reverse('session-detail', args=[other_session.id]))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        other_session.refresh_from_db()
+        self.assertIsNone(other_session.revoked_at)
+
+    def test_revoke_all_sessions(self):
+        """Test that logging out everywhere rejects every token issued before it"""
+        laptop = self.login('laptop')
+        phone = self.login('phone')
+        legacy = RefreshToken.for_user(self.user)
+        self.authorize(laptop)
+
+        response = self.client.post(reverse('session-revoke-all'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['revoked'], 2)
+        self.assertFalse(self.user.device_sessions.filter(revoked_at__isnull=True).exists())
+        for tokens in (laptop, phone):
+            self.authorize(tokens)
+            self.assertEqual(self.client.get(reverse('user-profile')).status_code,
+                             status.HTTP_401_UNAUTHORIZED)
+            refresh = self.client.post(reverse('token_refresh'), {'refresh': tokens['refresh']})
+            self.assertEqual(refresh.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.credentials()
+        refresh = self.client.post(reverse('token_refresh'), {'refresh': str(legacy)})
+        self.assertEqual(refresh.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_login_right_after_revoke_all(self):
+        """Test that a session started after logging out everywhere works at once"""
+        self.authorize(self.login('laptop'))
+        self.client.post(reverse('session-revoke-all'))
+        self.client.credentials()
+
+        tokens = self.login('laptop')
+        self.authorize(tokens)
+
+        self.assertEqual(self.client.get(reverse('user-profile')).status_code, status.HTTP_200_OK)
+        refresh = self.client.post(reverse('token_refresh'), {'refresh': tokens['refresh']})
+        self.assertEqual(refresh.status_code, status.HTTP_200_OK)
+
+    def test_token_endpoint_creates_session(self):
+        """Test that /api/token/ issues tokens backed by a device session"""
+        response = self.client.post(reverse('token_obtain_pair'), {
+            'username': 'deviceuser', 'password': 'testpass123',
+        }, HTTP_USER_AGENT='curl/8.0')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        session = self.user.device_sessions.get()
+        self.assertEqual(session.device_label, 'curl/8.0')
+        self.assertEqual(RefreshToken(response.data['refresh'])['sid'], str(session.id))
+
+#################################################################################
+
+class OutboxTests(APITestCase):
+    """Tests for the transactional outbox"""
+
+    def register(self, username='outboxuser'):
+        return self.client.post(reverse('register'), {
+            'username': username,
+            'email': f'{username}@example.com',
+            'password': 'testpass123',
+            'password_confirm': 'testpass123',
+        })
+
+    def test_registration_enqueues_welcome_email(self):
+        """Test that registering records the email instead of sending it inline"""
+        self.register()
+
+        self.assertEqual(len(mail.outbox), 0)
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.topic, 'email.welcome')
+        self.assertEqual(message.payload['email'], 'outboxuser@example.com')
+        self.assertEqual(message.user_id, User.objects.get(username='outboxuser').pk)
+
+    def test_failed_registration_enqueues_nothing(self):
+        """Test that the message shares the transaction of the user INSERT"""
+        with mock.patch('api.serializers.enqueue_registration', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.register()
+
+        self.assertFalse(User.objects.filter(username='outboxuser').exists())
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_run_outbox_delivers_email(self):
+        """Test that the worker sends pending emails and reports throughput"""
+        self.register('first')
+        self.register('second')
+        out = StringIO()
+        call_command('run_outbox', once=True, stdout=out)
+
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['first@example.com', 'second@example.com'])
+        self.assertFalse(OutboxMessage.objects.filter(status=OutboxMessage.PENDING).exists())
+        self.assertIn('delivered=2', out.getvalue())
+
+    def test_webhooks_enqueued_per_receiver(self):
+        """Test that each configured webhook gets its own message"""
+        with override_settings(OUTBOX_WEBHOOK_URLS=['http://a.invalid/hook', 'http://b.invalid/hook']):
+            self.register()
+
+        urls = OutboxMessage.objects.filter(topic='webhook').values_list('payload__url', flat=True)
+        self.assertEqual(sorted(urls), ['http://a.invalid/hook', 'http://b.invalid/hook'])
+
+    def test_delivery_runs_outside_transactions(self):
+        """Test that handlers run with no transaction open and outcomes are recorded"""
+        outbox.enqueue('webhook', {'url': 'http://hook.invalid/', 'body': {}})
+        baseline = len(connection.atomic_blocks)
+        depths = []
+        hook = mock.Mock(side_effect=lambda payload: depths.append(len(connection.atomic_blocks)))
+        with mock.patch.dict(outbox.handlers, {'webhook': hook}):
+            self.assertEqual(outbox.deliver_batch(), {'delivered': 1})
+
+        self.assertEqual(depths, [baseline])
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.status, message.attempts), (OutboxMessage.DELIVERED, 1))
+
+    def test_crashed_delivery_is_leased_not_resent(self):
+        """Test that a batch interrupted mid-way is retried only after its lease"""
+        first = outbox.enqueue('webhook', {'url': 'http://one.invalid/', 'body': {}})
+        second = outbox.enqueue('webhook', {'url': 'http://two.invalid/', 'body': {}})
+        calls = []
+
+        def crash_on_second(payload):
+            calls.append(payload['url'])
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+
+        with mock.patch.dict(outbox.handlers, {'webhook': crash_on_second}):
+            with self.assertRaises(KeyboardInterrupt):
+                outbox.deliver_batch()
+            self.assertEqual(outbox.deliver_batch(), {})
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status, OutboxMessage.DELIVERED)
+        self.assertEqual((second.status, second.attempts), (OutboxMessage.PENDING, 1))
+        self.assertGreater(second.available_at, timezone.now())
+
+    def test_run_outbox_once_purges_old_messages(self):
+        """Test that --once also deletes long-delivered messages"""
+        OutboxMessage.objects.create(topic='email.welcome', status=OutboxMessage.DELIVERED,
+                                     delivered_at=timezone.now() - timezone.timedelta(days=30))
+        call_command('run_outbox', once=True, stdout=StringIO())
+
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_failures_back_off_then_give_up(self):
+        """Test that failed deliveries are retried later and finally marked failed"""
+        message = outbox.enqueue('webhook', {'url': 'http://hook.invalid/', 'body': {}})
+        with override_settings(OUTBOX_MAX_ATTEMPTS=2, OUTBOX_BACKOFF_BASE=30), \
+                mock.patch.dict(outbox.handlers, {'webhook': mock.Mock(side_effect=OSError('down'))}):
+            self.assertEqual(outbox.deliver_batch(), {'retried': 1})
+            message.refresh_from_db()
+            self.assertEqual(message.attempts, 1)
+            self.assertGreater(message.available_at, timezone.now() + timedelta(seconds=25))
+            self.assertEqual(outbox.deliver_batch(), {})
+
+            OutboxMessage.objects.update(available_at=timezone.now())
+            self.assertEqual(outbox.deliver_batch(), {'failed': 1})
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.FAILED)
+        self.assertEqual(message.last_error, 'OSError: down')
+
+#################################################################################
+
+class PermissionCacheTests(APITestCase):
+    """Tests for the versioned permission cache"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('permuser', 'perm@example.com', 'testpass123', is_staff=True)
+        cls.group = Group.objects.create(name='editors')
+        cls.view_user = Permission.objects.get(codename='view_user')
+        cls.change_user = Permission.objects.get(codename='change_user')
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        # Permission sets are only cached in a cache shared by all processes.
+        self.enterContext(override_settings(CACHES=shared_caches(self.cache_dir)))
+
+    def fresh_user(self):
+        return User.objects.get(pk=self.user.pk)
+
+    def assert_bump_from_other_process_seen(self, caches_setting):
+        with override_settings(CACHES=caches_setting):
+            self.assertFalse(self.fresh_user().has_perm('api.view_user'))
+            # The grant happens in another process, which has its own cache client.
+            with mock.patch.object(permission_cache, 'cache', caches['other']), \
+                    self.captureOnCommitCallbacks(execute=True):
+                self.user.user_permissions.add(self.view_user)
+            self.assertTrue(self.fresh_user().has_perm('api.view_user'))
+
+    def test_bump_through_shared_cache_reaches_other_clients(self):
+        """Test that a version bumped through one client of a shared cache invalidates the other's entries"""
+        backend = 'django.core.cache.backends.filebased.FileBasedCache'
+        self.assert_bump_from_other_process_seen({
+            'default': {'BACKEND': backend, 'LOCATION': self.cache_dir},
+            'other': {'BACKEND': backend, 'LOCATION': self.cache_dir},
+        })
+
+    def test_process_local_cache_is_not_used(self):
+        """Test that permission sets are not cached where a bump could not reach other processes"""
+        backend = 'django.core.cache.backends.locmem.LocMemCache'
+        self.assert_bump_from_other_process_seen({
+            'default': {'BACKEND': backend, 'LOCATION': 'this-process'},
+            'other': {'BACKEND': backend, 'LOCATION': 'other-process'},
+        })
+
+    def test_permissions_claim_needs_shared_cache(self):
+        """Test that the claim is not issued, and a warning raised, with a process-local cache"""
+        self.assertEqual(check_permission_claims(None), [])
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(JWT_PERMISSIONS_CLAIM=True, CACHES=locmem):
+            self.assertEqual([w.id for w in check_permission_claims(None)], ['api.W001'])
+            response = self.client.post(reverse('login'), {'username': 'permuser', 'password': 'testpass123'})
+        self.assertNotIn('perms', AccessToken(response.data['token']['access']))
+
+    def test_permissions_served_from_cache(self):
+        """Test that a second request's user needs no permission queries"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.user_permissions.add(self.view_user)
+        self.assertTrue(self.fresh_user().has_perm('api.view_user'))
+
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perm('api.view_user'))
+            self.assertFalse(user.has_perm('api.change_user'))
+
+    def test_group_membership_change_invalidates(self):
+        """Test that adding the user to a group is visible immediately"""
+        self.group.permissions.add(self.change_user)
+        self.assertFalse(self.fresh_user().has_perm('api.change_user'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.add(self.group)
+
+        self.assertTrue(self.fresh_user().has_perm('api.change_user'))
+
+    def test_group_permission_change_invalidates_members(self):
+        """Test that changing a group's permissions reaches its members"""
+        self.user.groups.add(self.group)
+        self.assertFalse(self.fresh_user().has_perm('api.view_user'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.permissions.add(self.view_user)
+        self.assertTrue(self.fresh_user().has_perm('api.view_user'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.delete()
+        self.assertFalse(self.fresh_user().has_perm('api.view_user'))
+
+    def test_token_claim_avoids_permission_lookup(self):
+        """Test that a current permissions claim is used without a query"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.user_permissions.add(self.view_user)
+        with override_settings(JWT_PERMISSIONS_CLAIM=True):
+            response = self.client.post(reverse('login'), {'username': 'permuser', 'password': 'testpass123'})
+        token = AccessToken(response.data['token']['access'])
+        self.assertEqual(token['perms'], ['api.view_user'])
+
+        auth = ShardAwareJWTAuthentication()
+        user = auth.get_user(token)
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perm('api.view_user'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.user_permissions.remove(self.view_user)
+        self.assertFalse(auth.get_user(token).has_perm('api.view_user'))
@@ -6,6 +6,11 @@ urlpatterns = [
     path('login/', views.login_user, name='login'),
     path('profile/', views.get_user_profile, name='user-profile'),
     path('verify/', views.verify_token, name='verify-token'),
+    path('sessions/', views.list_sessions, name='session-list'),
+    path('sessions/revoke-all/', views.revoke_all, name='session-revoke-all'),
+    path('sessions/<uuid:session_id>/', views.delete_session, name='session-detail'),
+    path('users/', views.list_users, name='user-list'),
+    path('availability/', views.check_availability, name='check-availability'),
     path('health/', views.health_check, name='health-check'),
 
 ]
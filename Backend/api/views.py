@@ -1,18 +1,24 @@
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
+import json
 from django.contrib.auth import get_user_model
-from .serializers import UserRegistrationSerializer, UserLoginSerializer
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.db import IntegrityError
+from .serializers import UserRegistrationSerializer, UserLoginSerializer, UserProfileUpdateSerializer
+from .availability import availability_index
+from .listing import ListingError, iter_rows, list_page
+from .profile import VersionConflict, parse_if_match, profile_etag, update_profile
+from .device_sessions import SESSION_CLAIM, active_sessions, revoke_all_sessions, revoke_session
 
 User = get_user_model()
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def register_user(request):
-    serializer = UserRegistrationSerializer(data=request.data)
+    serializer = UserRegistrationSerializer(data=request.data, context={'request': request})
     if serializer.is_valid():
         user = serializer.save()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -21,38 +27,83 @@ def register_user(request):
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def login_user(request):
-    serializer = UserLoginSerializer(data=request.data)
+    serializer = UserLoginSerializer(data=request.data, context={'request': request})
     if serializer.is_valid():
         return Response(serializer.data, status=status.HTTP_200_OK)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-@api_view(['GET'])
+def _profile_data(user):
+    return {
+        'id': str(user.id),
+        'username': user.username,
+        'email': user.email,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'created_at': user.created_at,
+        'last_logged_in': user.last_logged_in,
+    }
+
+def _versioned(response, user):
+    # Clients may cache the payload but must revalidate it with If-None-Match.
+    response['ETag'] = profile_etag(user)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+@api_view(['GET', 'PATCH'])
 @permission_classes([IsAuthenticated])
 def get_user_profile(request):
     """
     Protected endpoint that returns user information.
     Requires valid JWT token in Authorization header.
+    PATCH updates the profile; send the ETag from GET as If-Match to detect
+    concurrent edits (412 Precondition Failed).
     """
+    if request.method == 'PATCH':
+        return update_user_profile(request)
     try:
         user = request.user
-        user_data = {
-            'id': str(user.id),
-            'username': user.username,
-            'email': user.email,
-            'first_name': user.first_name,
-            'last_name': user.last_name,
-            'created_at': user.created_at,
-            'last_logged_in': user.last_logged_in,
-        }
-        return Response({
+        if request.headers.get('If-None-Match') == profile_etag(user):
+            return _versioned(Response(status=status.HTTP_304_NOT_MODIFIED), user)
+        return _versioned(Response({
             'message': f'Congratulations, {user.username}!',
-            'user': user_data
-        }, status=status.HTTP_200_OK)
+            'user': _profile_data(user)
+        }, status=status.HTTP_200_OK), user)
     except Exception as e:
         return Response({
             'error': 'Failed to retrieve user profile'
         }, status=status.HTTP_400_BAD_REQUEST)
 
+def update_user_profile(request):
+    user = request.user
+    serializer = UserProfileUpdateSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    expected_version = None
+    if 'If-Match' in request.headers:
+        try:
+            expected_version = parse_if_match(request.headers['If-Match'])
+        except ValueError:
+            return Response({
+                'error': 'If-Match must be an ETag returned by this endpoint'
+            }, status=status.HTTP_412_PRECONDITION_FAILED)
+
+    email = serializer.validated_data.get('email')
+    email_error = {'email': ['user with this email already exists.']}
+    if email is not None and email != user.email and availability_index.is_taken('email', email):
+        return Response(email_error, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        update_profile(user, serializer.validated_data, expected_version)
+    except VersionConflict:
+        return Response({
+            'error': 'The profile was modified by another request; fetch it again'
+        }, status=status.HTTP_412_PRECONDITION_FAILED)
+    except IntegrityError:
+        return Response(email_error, status=status.HTTP_400_BAD_REQUEST)
+
+    return _versioned(Response({'user': _profile_data(user)}, status=status.HTTP_200_OK), user)
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def verify_token(request):
@@ -68,6 +119,78 @@ def verify_token(request):
         }
     }, status=status.HTTP_200_OK)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def list_sessions(request):
+    """
+    The devices signed in to this account, most recently used first.
+    ``current`` marks the session of the token making the request.
+    """
+    current = request.auth.get(SESSION_CLAIM) if request.auth else None
+    sessions = active_sessions(request.user).values('id', 'device_label', 'created_at', 'last_used_at')
+    return Response({
+        'sessions': [dict(session, current=str(session['id']) == current) for session in sessions]
+    }, status=status.HTTP_200_OK)
+
+@api_view(['DELETE'])
+@permission_classes([IsAuthenticated])
+def delete_session(request, session_id):
+    """
+    Signs one device out. Its refresh token stops working immediately and its
+    access tokens are rejected from the next request on.
+    """
+    if not revoke_session(request.user, session_id):
+        return Response({'error': 'Session not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def revoke_all(request):
+    """
+    Signs every device out, including the one making the request.
+    """
+    revoked = revoke_all_sessions(request.user)
+    return Response({'revoked': revoked}, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def list_users(request):
+    """
+    Staff-only user listing for internal services.
+    Cursor-paginated on (created_at, id); ``fields`` selects columns and
+    ``stream=ndjson`` exports every matching user as newline-delimited JSON.
+    """
+    params = request.query_params
+    try:
+        if params.get('stream') == 'ndjson':
+            rows = iter_rows(params)
+            lines = (json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in rows)
+            return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+        return Response(list_page(params), status=status.HTTP_200_OK)
+    except ListingError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def check_availability(request):
+    """
+    Reports whether a username and/or email is still free to register.
+    Most answers come from the in-memory availability index without a query.
+    """
+    result = {}
+    for field in ('username', 'email'):
+        value = request.query_params.get(field)
+        if value:
+            result[field] = {
+                'value': value,
+                'available': not availability_index.is_taken(field, value),
+            }
+    if not result:
+        return Response({
+            'error': 'Provide a username and/or email query parameter'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    return Response(result, status=status.HTTP_200_OK)
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def health_check(request):
@@ -0,0 +1,83 @@
+"""
+Import time and memory footprint of a worker per settings profile.
+
+    python benchmarks/import_footprint.py [--runs 5] [--output benchmarks/results/import_footprint.md]
+
+For every settings module a fresh interpreter is started under
+``python -X importtime``; it sets Django up and loads the WSGI application
+and URLconf, like a worker does before serving its first request. Reported
+are the summed import time, the number of imported modules and the peak RSS
+of the worker.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROFILES = ('Backend.settings', 'Backend.settings_api')
+
+WORKER = '''
+import resource
+from django.conf import settings
+from django.urls import get_resolver
+from Backend.wsgi import application
+get_resolver().url_patterns
+print('maxrss_kb', resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+'''
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+
+def measure(settings_module):
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', WORKER],
+        check=True, capture_output=True, text=True, cwd=BACKEND_DIR, env=env,
+    )
+    self_us = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us.append(int(match.group(1)))
+    maxrss_kb = int(result.stdout.split()[-1])
+    return {
+        'import_ms': sum(self_us) / 1000,
+        'modules': len(self_us),
+        'rss_mb': maxrss_kb / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', help='Also write the table to this file.')
+    args = parser.parse_args()
+
+    lines = [
+        f'median of {args.runs} runs, Python {sys.version.split()[0]}',
+        '',
+        '| settings | import time (ms) | modules | peak RSS (MB) |',
+        '|---|---:|---:|---:|',
+    ]
+    for profile in PROFILES:
+        runs = [measure(profile) for _ in range(args.runs)]
+        lines.append('| {} | {:.1f} | {} | {:.1f} |'.format(
+            profile,
+            statistics.median(r['import_ms'] for r in runs),
+            int(statistics.median(r['modules'] for r in runs)),
+            statistics.median(r['rss_mb'] for r in runs),
+        ))
+
+    table = '\n'.join(lines)
+    print(table)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(table + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Cold vs. preloaded worker startup benchmark.
+
+    python benchmarks/startup.py [--runs 5]
+
+"cold" starts a fresh interpreter per run and serves the first requests, the
+way a worker without ``preload_app`` does. "preloaded" warms the application
+once in a parent process (``Backend.serving.warm_up``) and forks a child per
+run, the way gunicorn forks workers from a preloaded master. For both, the
+time until the worker is ready and the latency of its first health check and
+first login are reported.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def configure(db_path):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Backend.settings')
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = db_path
+
+
+def first_requests():
+    """Serve a health check and a login; return their latencies in ms."""
+    from django.test import Client
+
+    client = Client(HTTP_HOST='localhost')
+    timings = {}
+    start = time.perf_counter()
+    client.get('/api/auth/health/')
+    timings['first_health_ms'] = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    response = client.post('/api/auth/login/', {'username': 'bench', 'password': 'bench-pass-123'})
+    timings['first_login_ms'] = (time.perf_counter() - start) * 1000
+    assert response.status_code == 200, response.content
+    return timings
+
+
+def prepare_database(db_path):
+    configure(db_path)
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.contrib.auth import get_user_model
+
+    call_command('migrate', verbosity=0)
+    get_user_model().objects.create_user('bench', 'bench@example.com', 'bench-pass-123')
+
+
+def cold_worker(db_path):
+    """Entry point of a fresh interpreter; prints its timings as JSON."""
+    start = time.perf_counter()
+    configure(db_path)
+    from Backend.wsgi import application  # noqa: F401
+    timings = {'ready_ms': (time.perf_counter() - start) * 1000}
+    timings.update(first_requests())
+    print(json.dumps(timings))
+
+
+def run_cold(db_path, runs):
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, __file__, '--cold-worker', db_path],
+            check=True, capture_output=True, text=True, cwd=BACKEND_DIR,
+        ).stdout
+        timings = json.loads(output.splitlines()[-1])
+        # Include interpreter start-up, which a cold worker also pays.
+        timings['ready_ms'] = (time.perf_counter() - start) * 1000 - timings['first_health_ms'] - timings['first_login_ms']
+        results.append(timings)
+    return results
+
+
+def run_preloaded(db_path, runs):
+    configure(db_path)
+    from Backend.serving import warm_up
+    from Backend.wsgi import application  # noqa: F401
+    warm_up()
+
+    results = []
+    for _ in range(runs):
+        read_fd, write_fd = os.pipe()
+        start = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            timings = {'ready_ms': (time.perf_counter() - start) * 1000}
+            timings.update(first_requests())
+            os.write(write_fd, json.dumps(timings).encode())
+            os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as pipe:
+            results.append(json.loads(pipe.read()))
+        os.waitpid(pid, 0)
+    return results
+
+
+def summarize(label, results):
+    row = [label]
+    for key in ('ready_ms', 'first_health_ms', 'first_login_ms'):
+        row.append(f'{statistics.median(r[key] for r in results):10.1f}')
+    return ' '.join(f'{cell:>16}' for cell in row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--cold-worker', metavar='DB', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold_worker:
+        cold_worker(args.cold_worker)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        subprocess.run(
+            [sys.executable, '-c', f'import sys; sys.path.insert(0, {BACKEND_DIR!r}); '
+             f'from benchmarks.startup import prepare_database; prepare_database({db_path!r})'],
+            check=True, cwd=BACKEND_DIR,
+        )
+        cold = run_cold(db_path, args.runs)
+        preloaded = run_preloaded(db_path, args.runs)
+
+    print(f'median of {args.runs} runs (ms)')
+    print(' '.join(f'{h:>16}' for h in ('worker', 'ready', 'first health', 'first login')))
+    print(summarize('cold', cold))
+    print(summarize('preloaded', preloaded))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Primary key insert benchmark: random UUIDv4 vs. time-ordered UUIDv7.
+
+    python benchmarks/uuid_inserts.py [--rows 1000000] [--postgres DSN] [--output FILE]
+
+Inserts ``--rows`` rows into a table shaped like ``api_user``'s primary key
+(``char(32)`` on SQLite, as Django stores UUIDField there; native ``uuid`` on
+PostgreSQL) in batches of ``--batch-size``, one transaction per batch.
+Reported are the total time, the throughput of the last 10% of rows (when the
+index no longer fits in cache, random keys hurt most) and the size of the
+table plus index. PostgreSQL is measured when ``--postgres`` is given and
+psycopg (3) or psycopg2 is installed.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Backend.settings')
+
+from api.ids import uuid7  # noqa: E402
+
+GENERATORS = {'uuid4': uuid.uuid4, 'uuid7': uuid7}
+
+
+def run_inserts(execute_batch, generate, rows, batch_size):
+    tail_start = rows - rows // 10
+    tail_began = None
+    start = time.perf_counter()
+    for offset in range(0, rows, batch_size):
+        if tail_began is None and offset >= tail_start:
+            tail_began = time.perf_counter()
+        count = min(batch_size, rows - offset)
+        execute_batch([(generate(), f'user{offset + i}') for i in range(count)])
+    end = time.perf_counter()
+    tail_rows = rows - tail_start
+    return {
+        'seconds': end - start,
+        'tail_rows_per_s': tail_rows / (end - (tail_began or start)),
+    }
+
+
+def bench_sqlite(generate, rows, batch_size):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        conn = sqlite3.connect(path, isolation_level=None)
+        conn.execute('CREATE TABLE users (id char(32) NOT NULL PRIMARY KEY, username varchar(150) NOT NULL)')
+
+        def execute_batch(batch):
+            conn.execute('BEGIN')
+            conn.executemany('INSERT INTO users (id, username) VALUES (?, ?)',
+                             [(value.hex, name) for value, name in batch])
+            conn.execute('COMMIT')
+
+        result = run_inserts(execute_batch, generate, rows, batch_size)
+        conn.close()
+        result['size_mb'] = os.path.getsize(path) / 1024 / 1024
+        return result
+
+
+def connect_postgres(dsn):
+    try:
+        import psycopg
+    except ImportError:
+        import psycopg2 as psycopg
+    return psycopg.connect(dsn)
+
+
+def bench_postgres(dsn, generate, rows, batch_size):
+    conn = connect_postgres(dsn)
+    with conn.cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS uuid_insert_bench')
+        cursor.execute('CREATE TABLE uuid_insert_bench (id uuid NOT NULL PRIMARY KEY, username varchar(150) NOT NULL)')
+    conn.commit()
+
+    def execute_batch(batch):
+        with conn.cursor() as cursor:
+            cursor.executemany('INSERT INTO uuid_insert_bench (id, username) VALUES (%s, %s)',
+                               [(str(value), name) for value, name in batch])
+        conn.commit()
+
+    result = run_inserts(execute_batch, generate, rows, batch_size)
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_total_relation_size('uuid_insert_bench')")
+        result['size_mb'] = cursor.fetchone()[0] / 1024 / 1024
+        cursor.execute('DROP TABLE uuid_insert_bench')
+    conn.commit()
+    conn.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--postgres', metavar='DSN', help='e.g. "dbname=bench user=postgres"')
+    parser.add_argument('--output', help='Also write the table to this file.')
+    args = parser.parse_args()
+
+    lines = [
+        f'{args.rows} rows, batches of {args.batch_size}',
+        '',
+        '| database | key | total (s) | last 10% (rows/s) | size (MB) |',
+        '|---|---|---:|---:|---:|',
+    ]
+    backends = [('sqlite', lambda gen: bench_sqlite(gen, args.rows, args.batch_size))]
+    if args.postgres:
+        backends.append(('postgresql', lambda gen: bench_postgres(args.postgres, gen, args.rows, args.batch_size)))
+
+    for database, bench in backends:
+        for key, generate in GENERATORS.items():
+            result = bench(generate)
+            lines.append(f"| {database} | {key} | {result['seconds']:.1f} | "
+                         f"{result['tail_rows_per_s']:,.0f} | {result['size_mb']:.1f} |")
+            print(lines[-1], flush=True)
+
+    table = '\n'.join(lines)
+    print()
+    print(table)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(table + '\n')
+
+
+if __name__ == '__main__':
+    main()
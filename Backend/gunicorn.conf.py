@@ -0,0 +1,49 @@
+"""
+Gunicorn configuration for production.
+
+    gunicorn -c gunicorn.conf.py
+
+Every setting can be overridden through the environment, e.g. to serve the
+ASGI application with uvicorn workers:
+
+    GUNICORN_APP=Backend.asgi:application \
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py
+
+The application is preloaded and warmed up in the master process, so workers
+are forked with the URL resolver, serializers, hasher and JWT key already
+initialised and share those pages copy-on-write.
+"""
+import gc
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Backend.settings')
+
+from Backend.serving import default_threads, default_workers, warm_up  # noqa: E402
+
+# Share (0..1) of request time spent hashing passwords; tune to the traffic mix.
+hashing_load = float(os.environ.get('GUNICORN_HASHING_LOAD', '0.5'))
+
+wsgi_app = os.environ.get('GUNICORN_APP', 'Backend.wsgi:application')
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('GUNICORN_WORKERS', default_workers(hashing_load=hashing_load)))
+threads = int(os.environ.get('GUNICORN_THREADS', default_threads(hashing_load=hashing_load)))
+
+preload_app = True
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+keepalive = 5
+# Recycle workers periodically; with preload they are cheap to re-fork.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+
+
+def when_ready(server):
+    warm_up()
+    # Move everything allocated so far out of the collector's reach so that
+    # collections in workers do not touch (and un-share) those pages.
+    gc.freeze()
+    server.log.info('Application warmed up; forking %s %s workers', workers, worker_class)
@@ -6,7 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Backend.settings')
+    # The test suite has its own, faster profile (Backend/settings_test.py).
+    default_settings = 'Backend.settings_test' if sys.argv[1:2] == ['test'] else 'Backend.settings'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', default_settings)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc: